@@ -1 +1 @@
-from .core import DistanceMatrix, Tree
+from .core import DistanceMatrix, CondensedDistanceMatrix, Tree, ArrayTree, SplitSet
\ No newline at end of file
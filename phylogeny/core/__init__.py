@@ -1,2 +1,7 @@
-from .distance import DistanceMatrix
-from .tree import Tree
\ No newline at end of file
+from .distance import DistanceMatrix, CondensedDistanceMatrix
+from .hamming import HammingAccumulator
+from .quartets import QuartetStore
+from .tree import Tree
+from .arraytree import ArrayTree
+from .splits import SplitSet
+from .consensus import SplitCounter
\ No newline at end of file
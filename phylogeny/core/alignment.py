@@ -0,0 +1,270 @@
+"""
+Streaming of binary alignments to and from files.
+
+An alignment of binary characters (like the ones simulated with
+the CFN model) may have more sites than fit in memory. Here it is
+handled as a stream of column blocks ``(start, stop, block)``,
+where ``block`` holds the sites ``start:stop`` of every sequence,
+either as an (n x sites) uint8 array of 0/1 states or packed in
+64-bit words like in `phylogeny.core.hamming`.
+
+The blocks can be written in three formats:
+
+    'packed'    -- A small JSON header and the packed blocks one
+                   after the other, so each one can be read back
+                   with a single read.
+    'phylip'    -- Interleaved PHYLIP, one group of lines per block.
+    'fasta'     -- FASTA with each sequence in a single line. The
+                   file is laid out beforehand and each block is
+                   written in place.
+
+Usage::
+
+    >>> names, blocks = simulate_blocks(tree, 10**8, seed=1)
+    >>> write_alignment('traits.phy', names, 10**8, blocks,
+                        format='phylip')
+
+    >>> for start, stop, block in read_alignment_blocks('traits.phy',
+                                                        format='phylip'):
+    ...     accumulate(block)
+"""
+
+import numpy as np
+from .hamming import pack_bits
+from .storage import write_header, read_header
+
+_MAGIC = b'PHYLOAL\0'
+_FORMATS = ('packed', 'phylip', 'fasta')
+
+# Sites read at a time from text files
+_READ_SITES = 1 << 16
+
+
+def _as_states(block, start, stop, packed):
+    "The 0/1 states of a (possibly packed) block of sites."
+    if not packed:
+        return np.asarray(block, dtype=np.uint8)
+    states = np.unpackbits(np.ascontiguousarray(block).view(np.uint8), axis=1)
+    return states[:, :stop - start]
+# ---
+
+def _as_text(states):
+    "The rows of a block of states as '0'/'1' bytes."
+    return [row.tobytes() for row in (states + ord('0')).astype(np.uint8)]
+# ---
+
+def _from_text(rows):
+    "A block of states from rows of '0'/'1' bytes."
+    states = np.frombuffer(b''.join(rows), dtype=np.uint8) - ord('0')
+    return states.reshape(len(rows), -1)
+# ---
+
+def write_alignment(path, names, n_sites, blocks, format='packed',
+                    packed=True):
+    """Write a stream of column blocks to a file.
+
+    Only one block is held in memory at a time.
+
+    Args:
+        path (str): File to create (it will be overwritten).
+        names (sequence): Names of the sequences.
+        n_sites (int): Total number of sites.
+        blocks (iterable): The ``(start, stop, block)`` blocks, in
+            order of their sites.
+        format (str, optional): 'packed', 'phylip' or 'fasta'.
+        packed (bool, optional): Whether the blocks are packed in
+            64-bit words (or are 0/1 uint8 arrays).
+    """
+    if format == 'packed':
+        _write_packed(path, names, n_sites, blocks, packed)
+    elif format == 'phylip':
+        _write_phylip(path, names, n_sites, blocks, packed)
+    elif format == 'fasta':
+        _write_fasta(path, names, n_sites, blocks, packed)
+    else:
+        raise ValueError(f"Unknown format: {format!r}. "
+                         f"Use one of {_FORMATS}.")
+# ---
+
+def read_alignment_blocks(path, format='packed', block_sites=None,
+                          packed=False):
+    """Read an alignment file as a stream of column blocks.
+
+    Yields tuples ``(start, stop, block)``, and only one block is
+    held in memory at a time.
+
+    Args:
+        path (str): The alignment file.
+        format (str, optional): 'packed', 'phylip' or 'fasta'.
+        block_sites (int, optional): Sites per block of a FASTA file
+            (a multiple of 64). The other formats are read in the
+            blocks they were written in.
+        packed (bool, optional): Yield the blocks packed in 64-bit
+            words instead of as 0/1 uint8 arrays.
+    """
+    if format == 'packed':
+        for start, stop, block in _read_packed(path):
+            if not packed:
+                block = _as_states(block, start, stop, packed=True)
+            yield start, stop, block
+        return
+    if format == 'phylip':
+        blocks = _read_phylip(path)
+    elif format == 'fasta':
+        blocks = _read_fasta(path, block_sites or _READ_SITES)
+    else:
+        raise ValueError(f"Unknown format: {format!r}. "
+                         f"Use one of {_FORMATS}.")
+    for start, stop, block in blocks:
+        yield start, stop, pack_bits(block) if packed else block
+# ---
+
+def read_alignment_names(path, format='packed'):
+    "The names of the sequences of an alignment file."
+    if format == 'packed':
+        return _read_header(path)[0]['names']
+    if format == 'phylip':
+        with open(path, 'rb') as f:
+            n, _ = (int(x) for x in f.readline().split())
+            return [f.readline().split()[0].decode() for _ in range(n)]
+    if format == 'fasta':
+        return [name for name, _, _ in _fasta_records(path)]
+    raise ValueError(f"Unknown format: {format!r}. Use one of {_FORMATS}.")
+# ---
+
+def _write_packed(path, names, n_sites, blocks, packed):
+    with open(path, 'wb') as f:
+        # The names keep their type, like those of the matrix files
+        write_header(f, {'names': list(names), 'n_sites': int(n_sites)},
+                     magic=_MAGIC)
+        for start, stop, block in blocks:
+            if not packed:
+                block = pack_bits(block)
+            # Each block: its first and last site, and its words
+            f.write(np.array([start, stop, block.shape[1]],
+                             dtype=np.uint64).tobytes())
+            np.ascontiguousarray(block, dtype=np.uint64).tofile(f)
+# ---
+
+def _read_header(path):
+    return read_header(path, magic=_MAGIC, kind='packed alignment')
+# ---
+
+def _read_packed(path):
+    header, offset = _read_header(path)
+    n = len(header['names'])
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        while True:
+            prefix = f.read(3*8)
+            if not prefix:
+                break
+            start, stop, n_words = np.frombuffer(prefix, dtype=np.uint64
+                                                ).tolist()
+            block = np.fromfile(f, dtype=np.uint64, count=n*n_words)
+            yield start, stop, block.reshape(n, n_words)
+# ---
+
+def _write_phylip(path, names, n_sites, blocks, packed):
+    names = [str(name) for name in names]
+    width = max(map(len, names)) + 1
+    with open(path, 'wb') as f:
+        f.write(f'{len(names)} {n_sites}\n'.encode())
+        for k, (start, stop, block) in enumerate(blocks):
+            rows = _as_text(_as_states(block, start, stop, packed))
+            if k:
+                f.write(b'\n')
+            for i, row in enumerate(rows):
+                # The names only go in the first block
+                if k == 0:
+                    f.write(names[i].ljust(width).encode())
+                f.write(row + b'\n')
+# ---
+
+def _read_phylip(path):
+    with open(path, 'rb') as f:
+        n, n_sites = (int(x) for x in f.readline().split())
+        start, first = 0, True
+        while start < n_sites:
+            rows = []
+            while len(rows) < n:
+                line = f.readline()
+                if not line:
+                    raise ValueError(f'{path} ends before its last site.')
+                line = line.strip()
+                if not line:
+                    # The blank line between blocks
+                    continue
+                if first:
+                    line = line.split(maxsplit=1)[1]
+                rows.append(line.replace(b' ', b''))
+            first = False
+            block = _from_text(rows)
+            stop = start + block.shape[1]
+            yield start, stop, block
+            start = stop
+# ---
+
+def _write_fasta(path, names, n_sites, blocks, packed):
+    # Lay out the file: the offset of the sequence of each record
+    headers = [f'>{name}\n'.encode() for name in names]
+    offsets = []
+    position = 0
+    for header in headers:
+        offsets.append(position + len(header))
+        position += len(header) + n_sites + 1
+
+    with open(path, 'wb') as f:
+        f.truncate(position)
+        for header, offset in zip(headers, offsets):
+            f.seek(offset - len(header))
+            f.write(header)
+            f.seek(offset + n_sites)
+            f.write(b'\n')
+        # Fill the columns of each block in place
+        for start, stop, block in blocks:
+            rows = _as_text(_as_states(block, start, stop, packed))
+            for offset, row in zip(offsets, rows):
+                f.seek(offset + start)
+                f.write(row)
+# ---
+
+def _fasta_records(path):
+    "The name, sequence offset and length of each record of a FASTA file."
+    records = []
+    with open(path, 'rb') as f:
+        while True:
+            header = f.readline()
+            if not header:
+                break
+            if not header.startswith(b'>'):
+                raise ValueError(f'{path} is not a single-line FASTA file.')
+            offset = f.tell()
+            # Skip over the sequence without reading it whole
+            length = 0
+            while True:
+                chunk = f.read(_READ_SITES)
+                end = chunk.find(b'\n')
+                if end >= 0 or not chunk:
+                    length += end if end >= 0 else len(chunk)
+                    break
+                length += len(chunk)
+            f.seek(offset + length + 1)
+            records.append((header[1:].strip().decode(), offset, length))
+    return records
+# ---
+
+def _read_fasta(path, block_sites):
+    if block_sites % 64:
+        raise ValueError('The sites per block must be a multiple of 64.')
+    records = _fasta_records(path)
+    n_sites = records[0][2] if records else 0
+    with open(path, 'rb') as f:
+        for start in range(0, n_sites, block_sites):
+            stop = min(n_sites, start + block_sites)
+            rows = []
+            for _, offset, _ in records:
+                f.seek(offset + start)
+                rows.append(f.read(stop - start))
+            yield start, stop, _from_text(rows)
+# ---
@@ -0,0 +1,436 @@
+"""
+Compact array-backed trees.
+
+Every node of an ete3-based `Tree` is a Python object with its own
+features dict, which is too heavy for trees with hundreds of
+thousands of leaves. An `ArrayTree` keeps the whole structure in
+a few NumPy arrays instead. The node ids are integers, and each
+node is described by:
+
+    parent          -- int32 id of the parent (-1 for the root)
+    first_child     -- int32 id of the first child (-1 for leaves)
+    next_sibling    -- int32 id of the next sibling (-1 for the last)
+    dist            -- float64 length of the branch above the node
+    names           -- The name of the node (None when unnamed)
+
+Usage::
+
+    >>> t = ArrayTree.from_newick('((A:1,B:2):1,C:3);')
+    >>> t.leaf_names()
+
+        ['A', 'B', 'C']
+
+    >>> t.add_as_sibling('D', 'C')
+    >>> t.write()
+
+        '((A:1,B:2):1,(C:1,D:1):1);'
+
+    # Convert from and to the ete3-based tree
+    >>> tree = t.to_tree()
+    >>> ArrayTree.from_tree(tree)
+
+        ArrayTree(<7 nodes, 4 leaves>)
+"""
+
+import re
+import numpy as np
+
+_NEWICK_TOKENS = re.compile(r'([(),;])')
+
+
+class ArrayTree:
+    """A rooted tree stored in parent/first-child/next-sibling arrays.
+
+    The nodes can be added one by one with `add_node`, in which case
+    the arrays grow geometrically, or all at once from an array of
+    parents. The methods used by the reconstruction algorithms
+    (`make_cherry_of`, `from_quartet` and `add_as_sibling`) follow
+    those of `Tree`, so both classes can be used to build a tree.
+    """
+
+    def __init__(self, parent=(), dist=None, names=None):
+        """
+        Args:
+            parent (iterable, optional): The parent id of each node,
+                -1 for the root. The children of a node are ordered
+                by their id.
+            dist (iterable, optional): Branch length of each node.
+            names (iterable, optional): Name of each node.
+        """
+        parent = np.asarray(parent, dtype=np.int32).reshape(-1)
+        n = self._size = len(parent)
+        capacity = max(n, 1)
+
+        self._parent = np.full(capacity, -1, dtype=np.int32)
+        self._first_child = np.full(capacity, -1, dtype=np.int32)
+        self._next_sibling = np.full(capacity, -1, dtype=np.int32)
+        self._last_child = np.full(capacity, -1, dtype=np.int32)
+        self._dist = np.ones(capacity, dtype=np.float64)
+        self._parent[:n] = parent
+        if dist is not None:
+            self._dist[:n] = dist
+        self.names = list(names) if names is not None else [None]*n
+        self._index = {}
+
+        roots = np.flatnonzero(parent < 0)
+        if len(roots) > 1:
+            raise ValueError('The tree has more than one root.')
+        self.root = int(roots[0]) if len(roots) else -1
+        self._link_children()
+    # ---
+
+    def _link_children(self):
+        "Fill the child and sibling arrays from the parents."
+        parent = self.parent
+        # The nodes with a parent, grouped by parent
+        order = np.argsort(parent, kind='stable')
+        children = order[parent[order] >= 0]
+        parents = parent[children]
+
+        same = parents[1:] == parents[:-1]
+        self._next_sibling[children[:-1]] = np.where(same, children[1:], -1)
+        first = np.concatenate([[True], ~same]) if len(children) else []
+        last = np.concatenate([~same, [True]]) if len(children) else []
+        self._first_child[parents[first]] = children[first]
+        self._last_child[parents[last]] = children[last]
+    # ---
+
+    def _grow(self):
+        "Double the capacity of the arrays."
+        for attr in ('_parent', '_first_child', '_next_sibling',
+                     '_last_child', '_dist'):
+            old = getattr(self, attr)
+            fill = 1.0 if attr == '_dist' else -1
+            new = np.full(2*len(old), fill, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, attr, new)
+    # ---
+
+    def _new_node(self, name=None, dist=1.0):
+        "Add a node without linking it to the tree."
+        if self._size == len(self._parent):
+            self._grow()
+        node = self._size
+        self._size += 1
+        self._parent[node] = -1
+        self._first_child[node] = -1
+        self._next_sibling[node] = -1
+        self._last_child[node] = -1
+        self._dist[node] = dist
+        self.names.append(name)
+        if name is not None and self._index:
+            self._index[name] = node
+        return node
+    # ---
+
+    def _append_child(self, parent, child):
+        "Link the child as the last child of the parent."
+        self._parent[child] = parent
+        last = self._last_child[parent]
+        if last < 0:
+            self._first_child[parent] = child
+        else:
+            self._next_sibling[last] = child
+        self._last_child[parent] = child
+    # ---
+
+    def add_node(self, parent=-1, name=None, dist=1.0):
+        """Add a node and return its id.
+
+        Args:
+            parent (int, optional): Id of the parent, -1 for the root.
+            name (optional): Name of the node.
+            dist (float, optional): Length of the branch above it.
+        """
+        if parent < 0 and self.root >= 0:
+            raise ValueError('The tree already has a root.')
+        node = self._new_node(name, dist)
+        if parent < 0:
+            self.root = node
+        else:
+            self._append_child(parent, node)
+        return node
+    # ---
+
+    @property
+    def parent(self):
+        return self._parent[:self._size]
+    # ---
+
+    @property
+    def first_child(self):
+        return self._first_child[:self._size]
+    # ---
+
+    @property
+    def next_sibling(self):
+        return self._next_sibling[:self._size]
+    # ---
+
+    @property
+    def dist(self):
+        return self._dist[:self._size]
+    # ---
+
+    def __len__(self):
+        return self._size
+    # ---
+
+    def __repr__(self):
+        return (f"{self.__class__.__name__}(<{len(self)} nodes, "
+                f"{self.n_leaves} leaves>)")
+    # ---
+
+    @property
+    def n_leaves(self):
+        return int(np.count_nonzero(self.first_child < 0))
+    # ---
+
+    def is_leaf(self, node):
+        return self._first_child[node] < 0
+    # ---
+
+    def children(self, node):
+        "The ids of the children of the node."
+        children = []
+        child = self._first_child[node]
+        while child >= 0:
+            children.append(int(child))
+            child = self._next_sibling[child]
+        return children
+    # ---
+
+    def node_of(self, name):
+        "The id of the node with the given name."
+        node = self._index.get(name)
+        if node is None or self.names[node] != name:
+            # Reindex the names
+            self._index = {name:i for i,name in enumerate(self.names)
+                                      if name is not None}
+            node = self._index[name]
+        return node
+    # ---
+
+    def preorder(self):
+        "The ids of the nodes in preorder."
+        first_child = self.first_child.tolist()
+        next_sibling = self.next_sibling.tolist()
+        order = []
+        stack = [self.root] if self.root >= 0 else []
+        while stack:
+            node = stack.pop()
+            order.append(node)
+            # Push the children, the first one on top
+            children = []
+            child = first_child[node]
+            while child >= 0:
+                children.append(child)
+                child = next_sibling[child]
+            stack.extend(reversed(children))
+        return np.array(order, dtype=np.int32)
+    # ---
+
+    def leaves(self):
+        "The ids of the leaves in preorder."
+        order = self.preorder()
+        return order[self.first_child[order] < 0]
+    # ---
+
+    def leaf_names(self):
+        return [self.names[i] for i in self.leaves().tolist()]
+    # ---
+
+    def depths(self):
+        "The distance from the root to each node."
+        depths = np.zeros(len(self))
+        parent = self.parent.tolist()
+        dist = self.dist.tolist()
+        for node in self.preorder()[1:].tolist():
+            depths[node] = depths[parent[node]] + dist[node]
+        return depths
+    # ---
+
+    @classmethod
+    def make_cherry_of(cls, a, b):
+        "Get a cherry tree out of both items."
+        tree = cls()
+        root = tree.add_node()
+        tree.add_node(root, name=a)
+        tree.add_node(root, name=b)
+        return tree
+    # ---
+
+    @classmethod
+    def from_quartet(cls, quartet):
+        "Transform the quartet ((a,b),(c,d)) to a tree."
+        tree = cls()
+        root = tree.add_node()
+        for pair in quartet:
+            cherry = tree.add_node(root)
+            for leaf in pair:
+                tree.add_node(cherry, name=leaf)
+        return tree
+    # ---
+
+    def add_as_sibling(self, a, b):
+        "Add leaf a as sibling of b in the tree."
+        b_node = self.node_of(b)
+        parent = self._parent[b_node]
+        if parent < 0:
+            raise ValueError(f'{b!r} is the root, it has no siblings.')
+        cherry = self._new_node()
+
+        # Put the cherry in the place of b
+        self._parent[cherry] = parent
+        self._next_sibling[cherry] = self._next_sibling[b_node]
+        if self._first_child[parent] == b_node:
+            self._first_child[parent] = cherry
+        else:
+            previous = self._first_child[parent]
+            while self._next_sibling[previous] != b_node:
+                previous = self._next_sibling[previous]
+            self._next_sibling[previous] = cherry
+        if self._last_child[parent] == b_node:
+            self._last_child[parent] = cherry
+
+        # Hang b and a from the cherry
+        self._next_sibling[b_node] = -1
+        self._dist[b_node] = 1.0
+        self._append_child(cherry, b_node)
+        self._append_child(cherry, self._new_node(a))
+    # ---
+
+    @classmethod
+    def from_tree(cls, tree):
+        "Create an array tree from an ete3-based tree."
+        return cls._from_nodes(list(tree.traverse('preorder')))
+    # ---
+
+    @classmethod
+    def _from_nodes(cls, nodes):
+        "Create an array tree from the ete3 nodes of a tree in preorder."
+        ids = {node:i for i,node in enumerate(nodes)}
+        parent = [ids[node.up] if node.up is not None else -1
+                     for node in nodes]
+        # Keep the root of a subtree as the root
+        parent[0] = -1
+        return cls(parent,
+                   dist=[node.dist for node in nodes],
+                   names=[node.name for node in nodes])
+    # ---
+
+    def to_tree(self, tree_class=None):
+        """Convert to an ete3-based tree.
+
+        Args:
+            tree_class (optional): The class of the tree, `Tree`
+                by default.
+        """
+        if tree_class is None:
+            from .tree import Tree as tree_class
+
+        names, dist = self.names, self.dist.tolist()
+        parent = self.parent.tolist()
+        nodes = {}
+        for node in self.preorder().tolist():
+            if node == self.root:
+                new = tree_class()
+                if names[node] is not None:
+                    new.name = names[node]
+                new.dist = dist[node]
+            else:
+                new = nodes[parent[node]].add_child(dist=dist[node])
+                if names[node] is not None:
+                    new.name = names[node]
+            nodes[node] = new
+        return nodes[self.root]
+    # ---
+
+    @classmethod
+    def from_newick(cls, newick):
+        """Read from the newick representation.
+
+        The labels of the internal nodes are read as their names,
+        and the nodes without a branch length get a length of 1.
+        """
+        tree = cls()
+        current = -1 # The open internal node
+        labelled = None # The node that a label would refer to
+        previous = None # The previous delimiter
+        tokens = _NEWICK_TOKENS.split(newick)
+        for i, token in enumerate(tokens):
+            if i % 2 == 0:
+                # A label between delimiters
+                label = token.strip()
+                following = tokens[i+1] if i+1 < len(tokens) else ';'
+                is_leaf = (    following in (',', ')', ';')
+                           and (previous in ('(', ',') 
+                                or (previous is None and label)))
+                if is_leaf:
+                    labelled = tree.add_node(current)
+                if labelled is not None and label:
+                    name, _, length = label.partition(':')
+                    name = name.strip().strip("'")
+                    if name:
+                        tree.names[labelled] = name
+                    if length.strip():
+                        tree._dist[labelled] = float(length)
+                continue
+
+            if token == '(':
+                current = tree.add_node(current)
+                labelled = None
+            elif token == ',':
+                labelled = None
+            elif token == ')':
+                labelled = current
+                current = int(tree._parent[current])
+            elif token == ';':
+                break
+            previous = token
+        return tree
+    # ---
+
+    def write(self, dist=True):
+        """The newick representation of the tree.
+
+        Args:
+            dist (bool, optional): Write the branch lengths.
+        """
+        names, lengths = self.names, self.dist.tolist()
+        first_child = self.first_child.tolist()
+        next_sibling = self.next_sibling.tolist()
+
+        def label(node):
+            name = names[node]
+            name = '' if name is None else str(name)
+            if dist and node != self.root:
+                name += f':{lengths[node]:g}'
+            return name
+
+        parts = []
+        # Visit each node and close it after its children
+        stack = [(self.root, False)] if self.root >= 0 else []
+        while stack:
+            node, closing = stack.pop()
+            if node is None:
+                parts.append(',')
+            elif closing:
+                parts.append(')' + label(node))
+            elif first_child[node] < 0:
+                parts.append(label(node))
+            else:
+                parts.append('(')
+                stack.append((node, True))
+                children = []
+                child = first_child[node]
+                while child >= 0:
+                    children.append(child)
+                    child = next_sibling[child]
+                for k, child in enumerate(reversed(children)):
+                    stack.append((child, False))
+                    if k < len(children) - 1:
+                        stack.append((None, None))
+        return ''.join(parts) + ';'
+    # ---
+# --- ArrayTree
@@ -0,0 +1,215 @@
+"""
+Consensus of many trees on the same leaves.
+
+The trees are read one at a time and only the frequency of each
+split is kept, in a dict keyed by its packed bitset (see
+`phylogeny.core.splits`). So the memory used depends on the number
+of distinct splits, but not on the number of trees, which can be
+streamed from a file with `read_trees`.
+
+The consensus trees are built from the counted splits:
+
+    'strict'    -- The splits of all the trees.
+    'majority'  -- The splits of more than half of the trees (or of
+                   another proportion given as the threshold).
+    'greedy'    -- The majority splits, and then the rest from the
+                   most to the least frequent, as long as they are
+                   compatible with the ones taken before.
+
+Usage::
+
+    >>> replicates = read_trees('bootstrap.nwk')
+    >>> consensus = consensus_tree(replicates, 'majority')
+    >>> [node.support for node in consensus.traverse()]
+"""
+
+import numpy as np
+from .arraytree import ArrayTree
+from .hamming import popcount
+from .splits import (leaf_index, as_array_tree, split_bitsets,
+                     split_keys, unpack_splits)
+from .tree import Tree
+
+_METHODS = ('strict', 'majority', 'greedy')
+
+# Characters read at a time from tree files
+_READ_CHARS = 1 << 16
+
+
+def read_trees(path):
+    "Yield the newick strings of a file with one or more trees."
+    with open(path) as f:
+        pending = ''
+        while True:
+            chunk = f.read(_READ_CHARS)
+            if not chunk:
+                break
+            *trees, pending = (pending + chunk).split(';')
+            for tree in trees:
+                if tree.strip():
+                    yield tree.strip() + ';'
+        if pending.strip():
+            raise ValueError(f'{path} ends in the middle of a tree.')
+# ---
+
+def compatible(split, splits):
+    """Whether a split is compatible with each of some others.
+
+    Two clades are compatible when they are disjoint or one contains
+    the other. The unrooted splits in the form of `tree_splits` (the
+    sides without the first leaf) are compatible in the same cases.
+    """
+    split = np.asarray(split, dtype=np.uint64)
+    both = (splits & split).any(axis=1)
+    only_split = (split & ~splits).any(axis=1)
+    only_other = (splits & ~split).any(axis=1)
+    return ~(both & only_split & only_other)
+# ---
+
+
+class SplitCounter:
+    """Count the splits of a stream of trees.
+
+    Usage::
+
+        >>> counter = SplitCounter()
+        >>> counter.update(read_trees('bootstrap.nwk'))
+        >>> counter.consensus('greedy')
+    """
+
+    def __init__(self, names=None, unrooted=False):
+        """
+        Args:
+            names (sequence, optional): The leaves of the trees. By
+                default, those of the first tree.
+            unrooted (bool, optional): Count the bipartitions of the
+                trees instead of their clades.
+        """
+        self.names = list(names) if names is not None else None
+        self._index = leaf_index(self.names) if names is not None else None
+        self.unrooted = unrooted
+        self.counts = {}
+        self.n_trees = 0
+    # ---
+
+    def add(self, tree):
+        "Count the splits of a `Tree`, an `ArrayTree` or a newick string."
+        if not hasattr(tree, 'splits'):
+            tree = as_array_tree(tree)
+        if self._index is None:
+            self.names = (tree.leaf_names() if isinstance(tree, ArrayTree)
+                          else tree.get_leaf_names())
+            self._index = leaf_index(self.names)
+
+        counts = self.counts
+        splits = split_bitsets(tree, self._index, self.unrooted)
+        for key in split_keys(splits).tolist():
+            counts[key] = counts.get(key, 0) + 1
+        self.n_trees += 1
+    # ---
+
+    def update(self, trees):
+        "Count the splits of each tree."
+        for tree in trees:
+            self.add(tree)
+    # ---
+
+    def __len__(self):
+        return len(self.counts)
+    # ---
+
+    def frequencies(self):
+        """The counted splits, from the most to the least frequent.
+
+        Returns:
+            A tuple ``(splits, counts)`` with the bitsets of the
+            splits and the number of trees that have each one.
+        """
+        n_words = max(1, (len(self.names or ()) + 63) // 64)
+        keys = list(self.counts)
+        splits = np.frombuffer(b''.join(keys), dtype=np.uint64
+                              ).reshape(-1, n_words)
+        counts = np.fromiter(self.counts.values(), dtype=np.int64,
+                             count=len(keys))
+        # The ties are broken by the bits, so the order is reproducible
+        order = np.lexsort(splits.T[::-1].tolist() + [-counts])
+        return splits[order], counts[order]
+    # ---
+
+    def consensus(self, method='majority', threshold=0.5):
+        """The consensus tree of the counted trees.
+
+        The support of each internal node is the proportion of the
+        trees that have its split.
+
+        Args:
+            method (str, optional): 'strict', 'majority' or 'greedy'.
+            threshold (float, optional): The proportion of the trees
+                that the splits of the majority-rule consensus must
+                exceed.
+        """
+        if not self.n_trees:
+            raise ValueError('No trees have been counted.')
+        splits, counts = self.frequencies()
+        if method == 'strict':
+            chosen = counts == self.n_trees
+        elif method == 'majority':
+            chosen = counts > threshold * self.n_trees
+        elif method == 'greedy':
+            chosen = counts > 0.5 * self.n_trees
+            # Up to the splits of a fully resolved tree
+            most = len(self.names) - (3 if self.unrooted else 2)
+            for i in np.flatnonzero(~chosen):
+                if chosen.sum() >= most:
+                    break
+                chosen[i] = compatible(splits[i], splits[chosen]).all()
+        else:
+            raise ValueError(f"Unknown method: {method!r}. "
+                             f"Use one of {_METHODS}.")
+        return self._build(splits[chosen], counts[chosen] / self.n_trees)
+    # ---
+
+    def _build(self, splits, support):
+        "A tree with the given compatible splits."
+        n = len(self.names)
+        root = Tree()
+        # The smallest node built so far that contains each leaf
+        owner = [root] * n
+
+        # Each split hangs from the node of its first leaf, once the
+        # larger splits are built
+        sizes = popcount(splits).sum(axis=1, dtype=np.int64)
+        for i in np.argsort(-sizes, kind='stable').tolist():
+            states = unpack_splits(splits[i:i+1], n)[0]
+            leaves = np.flatnonzero(states).tolist()
+            node = owner[leaves[0]].add_child(support=float(support[i]))
+            for leaf in leaves:
+                owner[leaf] = node
+        for leaf, name in enumerate(self.names):
+            owner[leaf].add_child(name=name)
+        return root
+    # ---
+# --- SplitCounter
+
+
+def consensus_tree(trees, method='majority', unrooted=False, names=None,
+                   threshold=0.5):
+    """The consensus of a stream of trees.
+
+    Args:
+        trees (iterable): `Tree` or `ArrayTree` objects or newick
+            strings (like the ones of `read_trees`), on the same leaves.
+        method (str, optional): 'strict', 'majority' or 'greedy'.
+        unrooted (bool, optional): Take the trees as unrooted.
+        names (sequence, optional): The leaves of the trees, in the
+            order that they'll have in the consensus.
+        threshold (float, optional): For the 'majority' method.
+
+    Returns:
+        A `Tree` with the proportion of the trees that have each split
+        as the support of its node.
+    """
+    counter = SplitCounter(names, unrooted)
+    counter.update(trees)
+    return counter.consensus(method, threshold)
+# ---
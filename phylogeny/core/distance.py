@@ -1,6 +1,9 @@
 import numpy as np
 import itertools as itr
-from .fpc import four_point_condition
+from .fpc import fpc_violation, sample_fpc_violations
+from .hamming import pack_sequences, hamming_blocks, HammingAccumulator
+from .storage import create_memmap, open_memmap, save_memmap
+from .parallel import parallel_distances
 
 def simple_distance(seq_1, seq_2):
     "From two binary sequences, compute their distance."
@@ -8,108 +11,404 @@ def simple_distance(seq_1, seq_2):
     return sum(differences)
 # ---
 
-class DistanceMatrix(np.ndarray):
-    """Wrapper for the Numpy array class with methods proper of a 
-    distance matrix.
-    
-    For documentation for the Numpy array, read the `Numpy documentation`_.
-    
-    .. _Numpy documentation:
-       http://www.numpy.org/
+def condensed_size(n):
+    "Number of entries above the diagonal of an n by n matrix."
+    return n*(n-1) // 2
+# ---
+
+def condensed_offset(n, i, j):
+    """Position of the entry (i,j), with i < j, in the condensed
+    (upper triangle) representation of an n by n matrix.
+
+    Works elementwise for arrays of indices too.
     """
+    return i*(2*n - i - 1)//2 + (j - i - 1)
+# ---
+
+def as_distance_matrix(data, names=None, compact=False):
+    """Wrap the data in a `DistanceMatrix`, unless it already is one.
     
-    def __new__(cls, data, names=None):
-        """        
-        Args:
-            data (iterable): Existing array.
-            names (int|str, optional): Names of the nodes.
-        """
-        matrix = np.asarray(data).view(cls)
-        
+    If `compact` is set, the returned matrix has no removed entries,
+    so it can be indexed by position (0 to n-1) along its names.
+    """
+    if not isinstance(data, (DistanceMatrix, CondensedDistanceMatrix)):
+        return DistanceMatrix(data, names=names)
+    if compact and not data.is_compact:
+        return data.compact()
+    return data
+# ---
+
+
+class _NamedDistances:
+    """Methods shared by the distance matrix storage variants.
+
+    The rows of the storage are tracked by an active set: the
+    `idx` map from each live name to its position in the storage,
+    and the boolean mask `active` over the positions. Discarding an
+    entry just updates both, without touching the distances.
+
+    The methods rely on the indexing `matrix[i,j]` by storage 
+    position, and on the `row`, `zeros`, `compact` and `_shallow`
+    methods of each variant.
+    """
+
+    def _index_names(self, names, n):
+        "Index the names of the n rows of the storage, all of them live."
         if not names:
-            n = len(matrix) 
             names = range(n)
-            
-        matrix.names = tuple(names)
-        matrix.idx = {name:i for i,name in enumerate(matrix.names)}
+        self.idx = {name:i for i,name in enumerate(names)}
+        self.active = np.ones(n, dtype=bool)
+        self._names = None
+    # ---
+
+    @property
+    def names(self):
+        "Names of the live entries, in storage order."
+        if self.idx is None:
+            return None
+        if self._names is None:
+            self._names = tuple(self.idx)
+        return self._names
+    # ---
+
+    @property
+    def is_compact(self):
+        "Are all the rows of the storage live?"
+        return len(self.idx) == len(self.active)
+    # ---
+
+    def live_indices(self):
+        "Storage positions of the live entries, in order."
+        return np.flatnonzero(self.active)
+    # ---
+
+    def discard(self, name):
+        """Remove the row and column with that name, in place.
         
-        return matrix
+        This is O(1): the entry is only masked out of the active set.
+        """
+        i = self.idx.pop(name)
+        self.active[i] = False
+        self._names = None
     # ---
-    
-    def __array_finalize__(self, obj):
-        if obj is None: 
-            # (we're in the middle of the __new__
-            # constructor, and self.names, self.idx 
-            # will be set when we return to
-            # __new__)
-            return
-        self.names = None
-        self.idx = None
+
+    def remove(self, name):
+        """Return a new matrix with the column and row with that name deleted.
+        
+        The live entries are copied into the new matrix. To remove
+        entries without copying, use `discard` (on a `shallow_copy`, 
+        to keep this matrix untouched).
+        """
+        matrix = self.shallow_copy()
+        matrix.discard(name)
+        return matrix.compact()
     # ---
-    
-    @classmethod
-    def zeros(cls, n, names=None):
-        """Return a zeroed n by n matrix"""
-        return cls(data=np.zeros((n,n)), 
-                   names=names)
+
+    def shallow_copy(self):
+        """A new matrix over the same storage, with its own active set.
+        
+        Entries can then be discarded from it without affecting 
+        this matrix.
+        """
+        matrix = self._shallow()
+        matrix.idx = dict(self.idx)
+        matrix.active = self.active.copy()
+        matrix._names = self._names
+        return matrix
     # ---
-    
+
     @classmethod
-    def from_sequences(cls, sequences, distance_fn=simple_distance):
-        "From the given sequences, compute pairwise edit distances."
+    def from_sequences(cls, sequences, distance_fn=None,
+                            block_size=None, workers=None, **kwargs):
+        """From the given sequences, compute pairwise edit distances.
+
+        When no `distance_fn` is given and the sequences are binary,
+        the Hamming distances are computed in blocks over the
+        bit-packed sequences. Otherwise, `distance_fn` (by default
+        `simple_distance`) is called on each pair of sequences.
+
+        Args:
+            sequences (dict): The sequences by name.
+            distance_fn (callable, optional): Distance between two sequences.
+            block_size (int, optional): Rows computed at a time by the
+                packed engine.
+            workers (int, optional): Call `distance_fn` in this many 
+                processes (see `parallel.parallel_distances`). The 
+                packed engine doesn't use them.
+            **kwargs: Passed to `zeros` (e.g. the `dtype`).
+        """
+        names = list(sequences.keys())
+        if distance_fn is None:
+            try:
+                packed, _ = pack_sequences([sequences[n] for n in names])
+            except ValueError:
+                # Not binary, use the slow path
+                distance_fn = simple_distance
+            else:
+                return cls.from_packed(packed, names, block_size, **kwargs)
+
+        if workers:
+            return parallel_distances(cls, [sequences[n] for n in names], 
+                                      distance_fn, workers, names=names,
+                                      **kwargs)
+
+        distances = cls.zeros(len(sequences), names=names, **kwargs)
         # Get all the pairs
         pairs = itr.combinations(sequences, 2)
         # Compute distances
-        distances = cls.zeros(len(sequences), names=sequences.keys())
         for i,j in pairs:
             d_ij = distance_fn(sequences[i], sequences[j])
             distances.set((i,j), d_ij)
         return distances
     # ---
-    
-    def __repr__(self):
-        return f"{super().__repr__()[:-1]}, names={self.names})"
+
+    @classmethod
+    def from_packed(cls, packed, names=None, block_size=None, **kwargs):
+        "Hamming distances between bit-packed sequences (see `hamming`)."
+        distances = cls.zeros(len(packed), names=names, **kwargs)
+        for start, stop, block in hamming_blocks(packed, block_size):
+            distances.set_block(start, stop, block)
+        return distances
     # ---
-    
-    def remove(self, name):
-        """Return a new matrix with the column and row with that name deleted."""
-        i = self.idx[name]
+
+    @classmethod
+    def from_blocks(cls, blocks, names, packed=False, **kwargs):
+        """Hamming distances over a stream of blocks of sites.
         
-        # Remove row
-        m = np.delete(self, (i), axis=0)
-        # Remove column
-        m = np.delete(m, (i), axis=1)
+        The blocks ``(start, stop, block)`` hold the sites start:stop 
+        of all the sequences, e.g. as read with 
+        `alignment.read_alignment_blocks`, and are accumulated one by 
+        one with a `hamming.HammingAccumulator`.
         
-        return DistanceMatrix(m, 
-                              names=(n for n in self.names if n != name))
-    # ---        
-    
-    def is_additive(self, tolerance=1e-2):
+        Args:
+            blocks (iterable): The blocks of sites.
+            names (sequence): Names of the sequences.
+            packed (bool, optional): Whether the blocks are bit-packed.
+            **kwargs: Passed to `HammingAccumulator.distance_matrix`
+                (e.g. `normalized` or the `dtype`).
+        """
+        accumulator = HammingAccumulator(len(names), names)
+        accumulator.update(blocks, packed)
+        return accumulator.distance_matrix(cls, **kwargs)
+    # ---
+
+    @staticmethod
+    def open(path, mode='r'):
+        """Map a matrix file into memory (see `storage.open_memmap`).
+        
+        The returned matrix is a `DistanceMatrix` or a 
+        `CondensedDistanceMatrix`, depending on how it was stored.
+        """
+        return open_memmap(path, mode)
+    # ---
+
+    def save(self, path):
+        "Write the matrix to a file (see `storage.save_memmap`)."
+        save_memmap(self, path)
+    # ---
+
+    def is_additive(self, tolerance=1e-2, sample=None, seed=None):
         """Is the distances matrix additive?
 
         Check the four point condition on each quartet of
-        indices of the matrix.
+        indices of the matrix, stopping at the first violation.
+        
+        As that is O(n^4), for large matrices a `sample` of random 
+        quartets can be checked instead, in which case the matrix
+        is taken as additive if none of them violates the condition 
+        (see `additivity_estimate`).
+        
+        Args:
+            tolerance (float, optional): As in `four_point_condition`.
+            sample (int, optional): Number of random quartets to check.
+            seed (optional): Seed or `numpy.random.Generator` for the sample.
         """
-        n = len(self)
-        quartets = list(itr.combinations(range(n), 4))
+        if sample is not None:
+            estimate = self.additivity_estimate(sample, tolerance, seed)
+            return estimate.violations == 0
+        return self.fpc_violation(tolerance) is None
+    # ---
 
-        return all(four_point_condition(self, q, tolerance) 
-                       for q in quartets)
+    def additivity_estimate(self, sample, tolerance=1e-2, seed=None,
+                            confidence=0.95):
+        """Estimate the rate of quartets violating the four point condition.
+        
+        Checks a `sample` of random quartets (or all of them, if there 
+        are no more) and returns an `fpc.AdditivityEstimate` of the rate, 
+        with its confidence interval::
+        
+            >>> m.additivity_estimate(10_000, seed=42)
+            
+                AdditivityEstimate(violation_rate=0.0012, low=0.0007, 
+                                   high=0.0021, violations=12, 
+                                   sampled=10000)
+        
+        Args:
+            sample (int): Number of random quartets to check.
+            tolerance (float, optional): As in `four_point_condition`.
+            seed (optional): Seed or `numpy.random.Generator` for the sample.
+            confidence (float, optional): Level of the interval.
+        """
+        matrix = as_distance_matrix(self, compact=True)
+        return sample_fpc_violations(matrix, sample, tolerance, 
+                                     seed, confidence)
     # ---
-    
+
+    def fpc_violation(self, tolerance=1e-2, worst=False):
+        """Find a quartet violating the four point condition.
+        
+        The quartets are checked in blocks (see `fpc.fpc_violation`).
+        
+        Args:
+            tolerance (float, optional): As in `four_point_condition`.
+            worst (bool, optional): Check every quartet and report
+                the one with the largest deviation.
+        
+        Returns:
+            None if the matrix is additive, otherwise the quartet 
+            of names and its deviation (the difference between the 
+            two largest four point sums).
+        """
+        matrix = as_distance_matrix(self, compact=True)
+        found = fpc_violation(matrix, tolerance, worst=worst)
+        if found is None:
+            return None
+        quartet, deviation = found
+        return tuple(matrix.names[i] for i in quartet), deviation
+    # ---
+
     def distances_to(self, name):
         "Get all the distances to the named sequence."
-        i = self.idx[name]
-        return {n:dist for n,dist in zip(self.names,self[i]) if n != name}
+        row = self.row(self.idx[name])
+        return {n:row[j] for n,j in self.idx.items() if n != name}
     # ---
-    
+
     def get(self, item):
         "Get item by name."
         i,j = item
         idx = self.idx
         return self[idx[i], idx[j]]
     # ---
-    
+
+    def name_all(self):
+        names = self.names
+        live = self.live_indices()
+        n = len(live)
+        for a in range(n):
+            row = self.row(live[a])
+            for b in range(a+1, n):
+                yield (names[a],names[b]), row[live[b]]
+    # ---
+
+    def closest_pair(self):
+        """The pair of names with the smallest distance, and the distance.
+
+        Equivalent to ``min(self.name_all(), key=...)``, including 
+        the tie-breaking (the first pair in row order wins), but 
+        reading the matrix one row at a time.
+        """
+        names = self.names
+        live = self.live_indices()
+        best, best_pair = None, None
+        for a in range(len(live) - 1):
+            row = self.row(live[a])[live[a+1:]]
+            b = np.argmin(row)
+            if best is None or row[b] < best:
+                best, best_pair = row[b], (names[a], names[a+1+b])
+        return best_pair, best
+    # ---
+
+    def _check_fits(self, block):
+        "Guard integer storage against silently wrapping values."
+        if np.issubdtype(self.dtype, np.integer) and block.size:
+            if block.max() > np.iinfo(self.dtype).max:
+                raise OverflowError(f'Distances do not fit in {self.dtype}.')
+    # ---
+# --- _NamedDistances
+
+
+class DistanceMatrix(np.ndarray, _NamedDistances):
+    """Wrapper for the Numpy array class with methods proper of a
+    distance matrix.
+
+    For documentation for the Numpy array, read the `Numpy documentation`_.
+
+    .. _Numpy documentation:
+       http://www.numpy.org/
+    """
+
+    def __new__(cls, data, names=None):
+        """
+        Args:
+            data (iterable): Existing array.
+            names (int|str, optional): Names of the nodes.
+        """
+        matrix = np.asarray(data).view(cls)
+        matrix._index_names(names, len(matrix))
+        return matrix
+    # ---
+
+    def __array_finalize__(self, obj):
+        if obj is None:
+            # (we're in the middle of the __new__
+            # constructor, and self.idx, self.active
+            # will be set when we return to
+            # __new__)
+            return
+        self.idx = None
+        self.active = None
+        self._names = None
+    # ---
+
+    @classmethod
+    def zeros(cls, n, names=None, dtype=np.float64, path=None):
+        """Return a zeroed n by n matrix.
+        
+        If a `path` is given, the matrix is mapped on a new file 
+        (see `storage.create_memmap`).
+        """
+        if path is not None:
+            return create_memmap(path, names or range(n), dtype)
+        return cls(data=np.zeros((n,n), dtype=dtype),
+                   names=names)
+    # ---
+
+    def __repr__(self):
+        return f"{super().__repr__()[:-1]}, names={self.names})"
+    # ---
+
+    def condensed(self, dtype=None):
+        "Copy the entries above the diagonal into a `CondensedDistanceMatrix`."
+        matrix = as_distance_matrix(self, compact=True)
+        return CondensedDistanceMatrix(matrix, names=matrix.names, dtype=dtype)
+    # ---
+
+    def _shallow(self):
+        "A new matrix object over the same storage."
+        return self.view(type(self))
+    # ---
+
+    def compact(self):
+        "Copy the live entries into a new matrix."
+        live = self.live_indices()
+        data = np.asarray(self)[np.ix_(live, live)]
+        return type(self)(data, names=self.names)
+    # ---
+
+    def row(self, i):
+        "The distances from the i-th element to all the others."
+        return np.asarray(self[i])
+    # ---
+
+    def entries(self, i, j):
+        "Entries (i[k], j[k]) by storage position, for arrays of indices."
+        matrix = np.asarray(self)
+        if matrix.flags.c_contiguous:
+            # Gathering from the flat array is cheaper
+            return matrix.ravel().take(np.asarray(i)*len(matrix) + j)
+        return matrix[i, j]
+    # ---
+
     def set(self, item, value):
         "Set item by name."
         i,j = item
@@ -117,13 +416,188 @@ class DistanceMatrix(np.ndarray):
         self[idx[i], idx[j]] = value
         self[idx[j], idx[i]] = value
     # ---
-    
-    def name_all(self):
-        names = self.names
-        n = len(names)
-        for i in range(n):
-            for j in range(i+1, n):
-                yield (names[i],names[j]), self[i,j]
+
+    def set_block(self, start, stop, block):
+        """Set the distances from the rows start:stop to the
+        rows start:n, and their symmetric entries."""
+        self._check_fits(block)
+        self[start:stop, start:] = block
+        self[start:, start:stop] = block.T
     # ---
-        
+
 # --- DistanceMatrix
+
+
+class CondensedDistanceMatrix(_NamedDistances):
+    """Distance matrix storing only the entries above the diagonal.
+
+    The n*(n-1)/2 distances are kept in a flat array, in the same
+    order as scipy's `squareform`: d(0,1), d(0,2), ..., d(0,n-1),
+    d(1,2), ... Each distance is stored (and written) only once,
+    and the storage type is configurable, e.g. `np.float32`, or
+    `np.uint16` for Hamming counts.
+
+    Usage::
+
+        >>> m = CondensedDistanceMatrix([[0, 3, 5],
+                                         [3, 0, 4],
+                                         [5, 4, 0]], names='abc')
+        >>> m.data
+
+            array([3., 5., 4.])
+
+        >>> m.get(('c', 'a'))
+
+            5.0
+    """
+
+    def __init__(self, data, names=None, dtype=None):
+        """
+        Args:
+            data (iterable): Existing square matrix, or the condensed
+                entries above its diagonal.
+            names (int|str, optional): Names of the nodes.
+            dtype (optional): Storage type. Defaults to the data's one.
+        """
+        data = np.asarray(data)
+        if data.ndim == 2:
+            # Take the upper triangle of a square matrix
+            n = len(data)
+            data = data[np.triu_indices(n, 1)]
+        else:
+            n = int(round((1 + np.sqrt(1 + 8*len(data))) / 2))
+            if condensed_size(n) != len(data):
+                raise ValueError('Invalid size for a condensed matrix.')
+
+        self.data = np.asarray(data, dtype=dtype)
+        self.n = n
+        self._index_names(names, n)
+    # ---
+
+    @classmethod
+    def zeros(cls, n, names=None, dtype=np.float64, path=None):
+        """Return a zeroed n by n matrix.
+        
+        If a `path` is given, the matrix is mapped on a new file 
+        (see `storage.create_memmap`).
+        """
+        if path is not None:
+            return create_memmap(path, names or range(n), dtype,
+                                 condensed=True)
+        return cls(data=np.zeros(condensed_size(n), dtype=dtype),
+                   names=names)
+    # ---
+
+    def __repr__(self):
+        return (f"{self.__class__.__name__}({self.data!r}, "
+                f"names={self.names})")
+    # ---
+
+    def __len__(self):
+        return self.n
+    # ---
+
+    @property
+    def shape(self):
+        return (self.n, self.n)
+    # ---
+
+    @property
+    def dtype(self):
+        return self.data.dtype
+    # ---
+
+    def __getitem__(self, item):
+        "Index by (i,j) position, or get the i-th row."
+        if isinstance(item, tuple):
+            i,j = item
+            if i == j:
+                return self.data.dtype.type(0)
+            if i > j:
+                i,j = j,i
+            return self.data[condensed_offset(self.n, i, j)]
+        return self.row(item)
+    # ---
+
+    def __setitem__(self, item, value):
+        "Set by (i,j) position."
+        i,j = item
+        if i == j:
+            raise IndexError('The diagonal of a distance matrix is fixed.')
+        if i > j:
+            i,j = j,i
+        self.data[condensed_offset(self.n, i, j)] = value
+    # ---
+
+    def row(self, i):
+        "The distances from the i-th element to all the others."
+        n = self.n
+        row = np.zeros(n, dtype=self.data.dtype)
+        # Entries (k,i) with k < i
+        k = np.arange(i)
+        row[:i] = self.data[condensed_offset(n, k, i)]
+        # Entries (i,k) with k > i are contiguous
+        start = condensed_offset(n, i, i+1)
+        row[i+1:] = self.data[start:start + n-i-1]
+        return row
+    # ---
+
+    def to_dense(self):
+        "Expand the live entries into a square `DistanceMatrix`."
+        if not self.is_compact:
+            return self.compact().to_dense()
+        n = self.n
+        dense = np.zeros((n,n), dtype=self.data.dtype)
+        rows, cols = np.triu_indices(n, 1)
+        dense[rows, cols] = self.data
+        dense[cols, rows] = self.data
+        return DistanceMatrix(dense, names=self.names)
+    # ---
+
+    def _shallow(self):
+        "A new matrix object over the same storage."
+        matrix = object.__new__(type(self))
+        matrix.data = self.data
+        matrix.n = self.n
+        return matrix
+    # ---
+
+    def compact(self):
+        "Copy the live entries into a new matrix."
+        live = self.live_indices()
+        n = len(live)
+        data = np.empty(condensed_size(n), dtype=self.data.dtype)
+        for a in range(n - 1):
+            start = condensed_offset(n, a, a+1)
+            data[start:start + n-a-1] = self.row(live[a])[live[a+1:]]
+        return type(self)(data, names=self.names)
+    # ---
+
+    def entries(self, i, j):
+        "Entries (i[k], j[k]) by storage position, for arrays of indices."
+        lo, hi = np.minimum(i, j), np.maximum(i, j)
+        values = np.zeros(lo.shape, dtype=self.data.dtype)
+        # The diagonal is not stored
+        off = (lo != hi)
+        values[off] = self.data[condensed_offset(self.n, lo[off], hi[off])]
+        return values
+    # ---
+
+    def set(self, item, value):
+        "Set item by name."
+        i,j = item
+        idx = self.idx
+        self[idx[i], idx[j]] = value
+    # ---
+
+    def set_block(self, start, stop, block):
+        """Set the distances from the rows start:stop to the
+        rows start:n (only the ones above the diagonal are kept)."""
+        self._check_fits(block)
+        n = self.n
+        for r, i in enumerate(range(start, stop)):
+            offset = condensed_offset(n, i, i+1)
+            self.data[offset:offset + n-i-1] = block[r, i-start+1:]
+    # ---
+
+# --- CondensedDistanceMatrix
@@ -31,12 +31,34 @@ the same.
         "Computational Phylogenetics. An introduction 
         to designing methods for phylogeny estimation"
         by Tandy Warnow
+
+Besides the per-quartet functions, there are batched versions 
+that evaluate the sums for blocks of quartets at once. The 
+quartets of indices are enumerated in blocks by their rank in 
+the combinatorial number system, so no list of all the 
+quartets is ever built.
 """
 
+from math import comb, sqrt
+from functools import lru_cache
+from collections import namedtuple
+from statistics import NormalDist
+import numpy as np
+
 _fpc_permutations = [(0,1,2,3),
                      (0,2,1,3),
                      (0,3,1,2)]
 
+_QUARTET_BLOCK = 1 << 16 # Quartets evaluated at a time
+
+def _entry(distances, i, j):
+    "Entry (i,j) of a matrix or of a nested sequence."
+    try:
+        return distances[i, j]
+    except TypeError:
+        return distances[i][j]
+# ---
+
 def fpc_sums(distances, idx_quartet=None):
     """From a matrix of distances and a quartet of indices, 
     return the sums needed to check the four point condition.
@@ -49,7 +71,8 @@ def fpc_sums(distances, idx_quartet=None):
     permutations = [ tuple(q[i] for i in p)
                         for p in _fpc_permutations ]
     # Calculate the relevant pairwise sums
-    sums = { ((i,j), (k,l)): distances[i][j] + distances[k][l]
+    sums = { ((i,j), (k,l)): (  _entry(distances, i, j)
+                              + _entry(distances, k, l))
                 for i,j,k,l in permutations }
     
     return sums
@@ -74,3 +97,203 @@ def four_point_condition(dist_matrix, idx_quartet=None, tolerance=1e-2):
         return False
     return True
 # ---
+
+def count_quartets(n):
+    "Number of quartets of n elements."
+    return comb(n, 4)
+# ---
+
+@lru_cache(maxsize=16)
+def _binomials(n, k):
+    "C(c,k) for every c < n (non decreasing on c)."
+    return np.array([comb(c, k) for c in range(n)], dtype=np.int64)
+# ---
+
+def unrank_quartets(n, ranks):
+    """Quartets of indices with the given ranks.
+    
+    The quartets are numbered in colexicographic order, the rank 
+    of the quartet a < b < c < d being C(d,4) + C(c,3) + C(b,2) + a.
+    
+    Returns:
+        An (m x 4) array with the sorted indices of each quartet.
+    """
+    ranks = np.array(ranks, dtype=np.int64)
+    quartets = np.empty((len(ranks), 4), dtype=np.int64)
+    for k in range(4, 0, -1):
+        binomials = _binomials(n, k)
+        # Largest index c with C(c,k) <= rank
+        c = np.searchsorted(binomials, ranks, side='right') - 1
+        quartets[:, k-1] = c
+        ranks -= binomials[c]
+    return quartets
+# ---
+
+def quartet_blocks(n, block_size=_QUARTET_BLOCK):
+    """Iterate over all the quartets of n indices in (m x 4) blocks.
+    
+    The quartets come in lexicographic order, the same as 
+    ``itertools.combinations(range(n), 4)``.
+    """
+    total = count_quartets(n)
+    for start in range(0, total, block_size):
+        stop = min(total, start + block_size)
+        # The lexicographic order is the reverse colexicographic
+        # order of the quartets with mirrored indices (i -> n-1-i)
+        ranks = np.arange(total-1 - start, total-1 - stop, -1)
+        yield (n-1 - unrank_quartets(n, ranks))[:, ::-1]
+# ---
+
+def _entries(distances, i, j):
+    "Entries (i[k], j[k]) of a matrix, for arrays of indices."
+    try:
+        return distances.entries(i, j)
+    except AttributeError:
+        return np.asarray(distances)[i, j]
+# ---
+
+def fpc_sums_block(distances, quartets):
+    """The four point condition sums for a block of quartets.
+    
+    Returns:
+        An (m x 3) array whose columns follow the splits of
+        `fpc_sums`: 01|23, 02|13 and 03|12.
+    """
+    quartets = np.asarray(quartets)
+    sums = np.empty((len(quartets), 3))
+    for s, (i,j,k,l) in enumerate(_fpc_permutations):
+        # Add in float64, so small integer storage doesn't wrap
+        ij = _entries(distances, quartets[:,i], quartets[:,j])
+        kl = _entries(distances, quartets[:,k], quartets[:,l])
+        sums[:, s] = ij.astype(np.float64) + kl.astype(np.float64)
+    return sums
+# ---
+
+def fpc_deviations(sums):
+    """How far is each quartet from satisfying the four point condition.
+    
+    That is, the difference between the two largest sums.
+    """
+    a, b, c = sums[:, 0], sums[:, 1], sums[:, 2]
+    high, low = np.maximum(a, b), np.minimum(a, b)
+    largest = np.maximum(high, c)
+    middle = np.maximum(low, np.minimum(high, c))
+    return largest - middle
+# ---
+
+def fpc_violation(distances, tolerance=1e-2, 
+                  block_size=_QUARTET_BLOCK, worst=False):
+    """Search for a quartet violating the four point condition.
+    
+    The tolerance has the same meaning as in `four_point_condition`.
+    The quartets are checked in blocks, so the memory used is 
+    bounded by the block size.
+    
+    Args:
+        distances: The matrix, indexed by positions 0 to n-1.
+        tolerance (float, optional): Allowed squared deviation.
+        block_size (int, optional): Quartets evaluated at a time.
+        worst (bool, optional): Instead of stopping at the first 
+            violation, check every quartet and report the worst.
+    
+    Returns:
+        None if every quartet satisfies the condition. Otherwise, 
+        the violating quartet of indices and its deviation.
+    """
+    found = None
+    for quartets in quartet_blocks(len(distances), block_size):
+        deviations = fpc_deviations(fpc_sums_block(distances, quartets))
+        k = np.argmax(deviations)
+        if deviations[k]**2 >= tolerance:
+            if found is None or deviations[k] > found[-1]:
+                found = (tuple(int(i) for i in quartets[k]), deviations[k])
+            if not worst:
+                break
+    return found
+# ---
+
+AdditivityEstimate = namedtuple('AdditivityEstimate',
+                                ['violation_rate', 'low', 'high',
+                                 'violations', 'sampled'])
+AdditivityEstimate.__doc__ = """Estimated rate of quartets violating the
+four point condition, with the bounds of its confidence interval, the 
+number of violations found and the number of quartets checked."""
+
+
+def wilson_interval(successes, trials, confidence=0.95):
+    "Wilson score interval for a binomial proportion."
+    if trials == 0:
+        return 0.0, 1.0
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    p = successes / trials
+    denominator = 1 + z**2/trials
+    center = (p + z**2/(2*trials)) / denominator
+    margin = z*sqrt(p*(1-p)/trials + z**2/(4*trials**2)) / denominator
+    return max(0.0, center - margin), min(1.0, center + margin)
+# ---
+
+def sample_quartets(n, sample, rng):
+    """Distinct random quartets of n indices, as an (m x 4) array.
+    
+    The quartets are drawn by their rank while it fits in int64. 
+    Beyond that (from about 125,000 indices), four distinct indices 
+    are drawn for each quartet and the repeated quartets are drawn 
+    again.
+    """
+    total = count_quartets(n)
+    if total <= np.iinfo(np.int64).max:
+        ranks = np.sort(rng.choice(total, size=sample, replace=False))
+        return unrank_quartets(n, ranks)
+    
+    quartets = np.empty((0, 4), dtype=np.int64)
+    while len(quartets) < sample:
+        drawn = np.sort(rng.integers(0, n, size=(sample - len(quartets), 4)),
+                        axis=1)
+        distinct = (np.diff(drawn, axis=1) > 0).all(axis=1)
+        quartets = np.unique(np.concatenate([quartets, drawn[distinct]]),
+                             axis=0)
+    return quartets
+# ---
+
+def sample_fpc_violations(distances, sample, tolerance=1e-2, seed=None,
+                          confidence=0.95, block_size=_QUARTET_BLOCK):
+    """Estimate the rate of quartets violating the four point condition.
+    
+    Checks `sample` random quartets, drawn without replacement, 
+    with the same tolerance as `four_point_condition`. If there 
+    are no more quartets than that, all of them are checked and 
+    the rate is exact.
+    
+    Args:
+        distances: The matrix, indexed by positions 0 to n-1.
+        sample (int): Number of quartets to check.
+        tolerance (float, optional): Allowed squared deviation.
+        seed (optional): Seed or `numpy.random.Generator`.
+        confidence (float, optional): Level of the interval.
+        block_size (int, optional): Quartets evaluated at a time.
+    
+    Returns:
+        An `AdditivityEstimate`.
+    """
+    n = len(distances)
+    exhaustive = (sample >= count_quartets(n))
+    if exhaustive:
+        blocks = quartet_blocks(n, block_size)
+    else:
+        quartets = sample_quartets(n, sample, np.random.default_rng(seed))
+        blocks = (quartets[start:start + block_size]
+                     for start in range(0, len(quartets), block_size))
+    
+    violations, sampled = 0, 0
+    for block in blocks:
+        deviations = fpc_deviations(fpc_sums_block(distances, block))
+        violations += int(np.count_nonzero(deviations**2 >= tolerance))
+        sampled += len(block)
+    
+    rate = violations / sampled if sampled else 0.0
+    if exhaustive:
+        low, high = rate, rate
+    else:
+        low, high = wilson_interval(violations, sampled, confidence)
+    return AdditivityEstimate(rate, low, high, violations, sampled)
+# ---
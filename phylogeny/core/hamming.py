@@ -0,0 +1,280 @@
+"""
+Batched Hamming distances between binary sequences.
+
+Binary sequences (like the ones generated by the CFN model)
+are packed 64 characters per machine word. The number of
+differences between two sequences is then the population
+count of the XOR of their words, which lets us compute all
+the pairwise distances in blocks instead of one pair at a
+time.
+
+Usage::
+
+    >>> packed, n_sites = pack_sequences([[0,1,1,0],
+                                          [1,1,1,0],
+                                          [0,0,0,1]])
+    >>> for start, stop, block in hamming_blocks(packed):
+    ...     print(start, stop, block)
+
+        0 3 [[0 1 3]
+             [1 0 4]
+             [3 4 0]]
+"""
+
+import numpy as np
+
+
+# Maximum number of 64-bit words held by a temporary XOR block.
+_BLOCK_WORDS = 1 << 22
+
+# Maximum number of characters converted at a time when packing.
+_SEQUENCE_CHARS = 1 << 22
+
+# Population count of every possible byte
+_BYTE_POPCOUNT = np.array([bin(i).count('1') for i in range(256)],
+                          dtype=np.uint8)
+
+
+def popcount(words):
+    "Number of set bits of each 64-bit word."
+    if hasattr(np, 'bitwise_count'):
+        # Numpy >= 2.0
+        return np.bitwise_count(words)
+    # Count byte by byte
+    as_bytes = words.view(np.uint8).reshape(*words.shape, 8)
+    return _BYTE_POPCOUNT[as_bytes].sum(axis=-1, dtype=np.uint8)
+# ---
+
+def _binary_blocks(sequences):
+    """The sequences as uint8 blocks of rows, checking they are binary.
+
+    Only a block of rows is converted at a time, so the whole input 
+    is never copied into a wider integer matrix.
+
+    Raises:
+        ValueError: If the sequences are not binary or not all of 
+            the same length.
+    """
+    n_sites = None
+    n = len(sequences)
+    rows = max(1, _SEQUENCE_CHARS // max(1, len(sequences[0]))) if n else 1
+    for start in range(0, n, rows):
+        try:
+            block = np.asarray(sequences[start:start + rows])
+        except ValueError:
+            # Ragged sequences
+            block = None
+        if (   block is None or block.ndim != 2 
+            or block.dtype.kind not in 'biu'
+            or (n_sites is not None and block.shape[1] != n_sites)
+            or not ((block == 0) | (block == 1)).all()):
+            raise ValueError('Sequences must be binary and of the same length.')
+        n_sites = block.shape[1]
+        yield start, block.astype(np.uint8, copy=False)
+# ---
+
+def is_binary(sequences):
+    "Are all the sequences binary and of the same length?"
+    try:
+        for _ in _binary_blocks(sequences):
+            pass
+    except ValueError:
+        return False
+    return True
+# ---
+
+def pack_bits(matrix):
+    """Pack the rows of a 0/1 matrix into 64-bit words.
+
+    The rows are padded with zeros up to a multiple of 64
+    characters, which doesn't affect the distances.
+    """
+    matrix = np.asarray(matrix, dtype=np.uint8)
+    n, n_sites = matrix.shape
+    packed = np.packbits(matrix, axis=1)
+    # Pad each row to a whole number of words
+    padding = (-packed.shape[1]) % 8
+    if padding:
+        packed = np.pad(packed, ((0,0), (0,padding)))
+    return np.ascontiguousarray(packed).view(np.uint64)
+# ---
+
+def pack_sequences(sequences):
+    """Pack binary sequences into an (n x words) array of uint64.
+
+    The sequences are checked and packed a block of rows at a time.
+
+    Returns:
+        The packed array and the number of sites.
+    """
+    packed, n_sites = None, 0
+    for start, block in _binary_blocks(sequences):
+        if packed is None:
+            n_sites = block.shape[1]
+            packed = np.zeros((len(sequences), (n_sites + 63) // 64), 
+                              dtype=np.uint64)
+        packed[start:start + len(block)] = pack_bits(block)
+    if packed is None:
+        raise ValueError('Sequences must be binary and of the same length.')
+    return packed, n_sites
+# ---
+
+def _block_rows(n, n_words):
+    "Rows per block so that the XOR temporaries stay bounded."
+    return max(1, _BLOCK_WORDS // max(1, n*n_words))
+# ---
+
+def _word_chunk(n, n_words):
+    "Words per chunk when even a single row doesn't fit the budget."
+    return max(1, min(n_words, _BLOCK_WORDS // max(1, n)))
+# ---
+
+def hamming_rows(packed, start, stop, columns_from=0):
+    """Hamming distances of rows [start, stop) against rows [columns_from, n).
+
+    The computation is chunked along the words so that the
+    temporaries never exceed the block budget.
+    """
+    rows = packed[start:stop]
+    columns = packed[columns_from:]
+    n_words = packed.shape[1]
+    chunk = _word_chunk(len(columns) * len(rows), n_words)
+
+    counts = np.zeros((len(rows), len(columns)), dtype=np.int64)
+    for w in range(0, n_words, chunk):
+        xor = rows[:, None, w:w+chunk] ^ columns[None, :, w:w+chunk]
+        counts += popcount(xor).sum(axis=-1, dtype=np.int64)
+    return counts
+# ---
+
+def hamming_blocks(packed, block_size=None):
+    """Compute the pairwise Hamming distances in blocks of rows.
+
+    Yields tuples ``(start, stop, block)`` where ``block`` holds
+    the distances from the rows ``start:stop`` to the rows
+    ``start:n``, so only the upper triangle of the matrix (and
+    the diagonal blocks) gets computed.
+    """
+    n, n_words = packed.shape
+    if block_size is None:
+        block_size = _block_rows(n, n_words)
+
+    for start in range(0, n, block_size):
+        stop = min(n, start + block_size)
+        yield start, stop, hamming_rows(packed, start, stop, start)
+# ---
+
+class HammingAccumulator:
+    """Running Hamming distances over blocks of alignment columns.
+    
+    The differences of each block of sites (e.g. read with 
+    `phylogeny.core.alignment.read_alignment_blocks`, or sliced 
+    from a memmap) are added to the counts of every pair, kept 
+    in a condensed int64 array. The distances so far can be taken 
+    at any time, so the whole alignment is never in memory.
+    
+    Usage::
+    
+        >>> accumulator = HammingAccumulator(len(names), names)
+        >>> for start, stop, block in read_alignment_blocks(path):
+        ...     accumulator.add(block)
+        ...     estimate = accumulator.distance_matrix(normalized=True)
+    """
+    
+    def __init__(self, n, names=None, block_size=None, dtype=np.int64):
+        """
+        Args:
+            n (int): Number of sequences.
+            names (iterable, optional): Names of the sequences.
+            block_size (int, optional): Rows computed at a time 
+                (see `hamming_blocks`).
+            dtype (optional): Storage type of the distance matrices 
+                of the counts. The counts themselves are int64, and 
+                only checked to fit when they are stored.
+        """
+        self.n = n
+        self.names = list(names) if names is not None else None
+        self.block_size = block_size
+        self.dtype = np.dtype(dtype)
+        self.counts = np.zeros(n*(n-1) // 2, dtype=np.int64)
+        self.n_sites = 0
+    # ---
+    
+    def add(self, block):
+        "Add the differences of an (n x sites) block of 0/1 states."
+        block = np.asarray(block)
+        self.add_packed(pack_bits(block), block.shape[1])
+    # ---
+    
+    def add_packed(self, packed, n_sites):
+        """Add the differences of a block of bit-packed sites.
+        
+        Args:
+            packed (np.ndarray): (n x words) uint64 packed sites.
+            n_sites (int): Number of sites in the block.
+        """
+        from .distance import condensed_offset
+        n, counts = self.n, self.counts
+        for start, stop, block in hamming_blocks(packed, self.block_size):
+            for r, i in enumerate(range(start, stop)):
+                # Row i of the upper triangle
+                offset = condensed_offset(n, i, i+1)
+                counts[offset:offset + n-i-1] += block[r, i-start+1:]
+        self.n_sites += n_sites
+    # ---
+    
+    def update(self, blocks, packed=False):
+        """Add a stream of ``(start, stop, block)`` blocks of sites.
+        
+        Args:
+            blocks (iterable): The blocks.
+            packed (bool, optional): Whether the blocks are packed 
+                in 64-bit words (or are 0/1 states).
+        """
+        for start, stop, block in blocks:
+            if packed:
+                self.add_packed(block, stop - start)
+            else:
+                self.add(block)
+        return self
+    # ---
+    
+    def distance_matrix(self, matrix_class=None, normalized=False, 
+                        dtype=None, path=None):
+        """The distances accumulated so far.
+        
+        Args:
+            matrix_class (optional): `DistanceMatrix` (the default) 
+                or `CondensedDistanceMatrix`.
+            normalized (bool, optional): Divide the counts by the 
+                number of sites seen.
+            dtype (optional): Storage type of the entries. By default, 
+                the `dtype` of the accumulator (float64 if normalized).
+            path (optional): As in the `zeros` of the class.
+        """
+        from .distance import (DistanceMatrix, CondensedDistanceMatrix,
+                               condensed_offset)
+        if matrix_class is None:
+            matrix_class = DistanceMatrix
+        
+        values = self.counts
+        if normalized:
+            values = values / max(1, self.n_sites)
+        if dtype is None:
+            dtype = values.dtype if normalized else self.dtype
+        
+        n = self.n
+        matrix = matrix_class.zeros(n, names=self.names, dtype=dtype, 
+                                    path=path)
+        matrix._check_fits(values)
+        if isinstance(matrix, CondensedDistanceMatrix):
+            matrix.data[:] = values
+            return matrix
+        for i in range(n):
+            offset = condensed_offset(n, i, i+1)
+            row = values[offset:offset + n-i-1]
+            matrix[i, i+1:] = row
+            matrix[i+1:, i] = row
+        return matrix
+    # ---
+# --- HammingAccumulator
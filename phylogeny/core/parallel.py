@@ -0,0 +1,224 @@
+"""
+Pairwise distances computed by a pool of processes.
+
+A distance function that can't be vectorized has to be called
+once per pair of sequences. Here the pairs above the diagonal are
+split into rectangular tiles of rows and columns, which are handed
+to a `ProcessPoolExecutor`. Each task only carries the bounds of
+its tile: the sequences are given to the workers once, when they
+start, and the workers write the distances straight into the
+output matrix. The matrix is built on a shared memory block, which
+it keeps mapped after the workers are done (or on the file of a
+memory-mapped matrix), so its entries are never copied.
+
+Sequences given as NumPy arrays (of the same shape and type) are
+stacked into shared memory as well, so no worker ever gets a copy
+of them. Other sequences are inherited by the workers when they
+are forked, and pickled once per worker otherwise.
+"""
+
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+# State of each worker process, set by `_init_worker`
+_worker = {}
+
+
+def tiles(n, tile_size):
+    """Tiles of rows and columns covering the pairs above the diagonal.
+
+    Yields tuples ``(row_start, row_stop, col_start, col_stop)``.
+    """
+    for a in range(0, n, tile_size):
+        for c in range(a, n, tile_size):
+            yield a, min(n, a + tile_size), c, min(n, c + tile_size)
+# ---
+
+def _tile_size(n, workers):
+    "Side of the tiles, so that there are several tasks per worker."
+    tasks = 8 * workers
+    size = int(n / np.sqrt(2*tasks)) if n else 1
+    return max(1, size)
+# ---
+
+def _shared_empty(shape, dtype):
+    "A new shared memory block, an array on it and its description."
+    dtype = np.dtype(dtype)
+    size = int(np.prod(shape)) * dtype.itemsize
+    shm = shared_memory.SharedMemory(create=True, size=max(1, size))
+    array = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    return shm, array, ('shm', shm.name, shape, dtype.str)
+# ---
+
+def _share_sequences(sequences):
+    """Stack the sequences into shared memory, if they are arrays of a kind.
+
+    Returns the block and its description, or None.
+    """
+    if isinstance(sequences, np.ndarray):
+        if sequences.dtype == object:
+            return None
+        shm, shared, description = _shared_empty(sequences.shape,
+                                                 sequences.dtype)
+        shared[...] = sequences
+        return shm, description
+
+    first = sequences[0] if len(sequences) else None
+    if not isinstance(first, np.ndarray) or first.dtype == object:
+        return None
+    if not all(isinstance(s, np.ndarray) and s.shape == first.shape 
+               and s.dtype == first.dtype for s in sequences):
+        return None
+    shm, shared, description = _shared_empty((len(sequences),) + first.shape,
+                                             first.dtype)
+    np.stack(sequences, out=shared)
+    return shm, description
+# ---
+
+
+class _SharedBlock:
+    """A new shared memory block, seen by NumPy as an array.
+
+    The arrays made from it (with `np.asarray`) and their views keep 
+    the block alive, so it's only unmapped after the last of them is 
+    gone.
+    """
+
+    def __init__(self, shape, dtype):
+        dtype = np.dtype(dtype)
+        size = int(np.prod(shape)) * dtype.itemsize
+        self.shm = shared_memory.SharedMemory(create=True, size=max(1, size))
+        address = np.frombuffer(self.shm.buf, dtype=np.uint8
+                               ).__array_interface__['data'][0]
+        self.__array_interface__ = {'shape': shape,
+                                    'typestr': dtype.str,
+                                    'data': (address, False),
+                                    'version': 3}
+        self.description = ('shm', self.shm.name, shape, dtype.str)
+    # ---
+# --- _SharedBlock
+
+
+def _shared_matrix(matrix_class, n, names, dtype):
+    """A zeroed matrix on a new shared memory block.
+
+    Returns the matrix and the block.
+    """
+    from .distance import CondensedDistanceMatrix, condensed_size
+    if issubclass(matrix_class, CondensedDistanceMatrix):
+        shape = (condensed_size(n),)
+    else:
+        shape = (n, n)
+    # New blocks are zero-filled
+    block = _SharedBlock(shape, dtype)
+    return matrix_class(np.asarray(block), names=names), block
+# ---
+
+def _attach(description):
+    "The array described by `_shared_empty` or by a matrix file path."
+    kind, *args = description
+    if kind == 'shm':
+        name, shape, dtype = args
+        shm = shared_memory.SharedMemory(name=name)
+        array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+        return shm, array
+    from .storage import open_memmap
+    from .distance import CondensedDistanceMatrix
+    (path,) = args
+    matrix = open_memmap(path, mode='r+')
+    if isinstance(matrix, CondensedDistanceMatrix):
+        return matrix, matrix.data
+    return matrix, np.asarray(matrix)
+# ---
+
+def _init_worker(sequences, output, distance_fn):
+    "Attach the worker to the sequences and the output."
+    if isinstance(sequences, tuple) and sequences[0] == 'shm':
+        handle, sequences = _attach(sequences)
+        _worker['sequences_handle'] = handle
+    handle, out = _attach(output)
+    _worker.update(sequences=sequences, n=len(sequences), out=out, 
+                   out_handle=handle, distance_fn=distance_fn)
+# ---
+
+def _compute_tile(tile):
+    "Compute the distances of a tile and write them to the output."
+    from .distance import condensed_offset
+    a, b, c, d = tile
+    sequences = _worker['sequences']
+    distance_fn = _worker['distance_fn']
+    out = _worker['out']
+
+    rows, cols, values = [], [], []
+    for i in range(a, b):
+        for j in range(max(c, i+1), d):
+            rows.append(i)
+            cols.append(j)
+            values.append(distance_fn(sequences[i], sequences[j]))
+    if not values:
+        return 0
+    rows, cols, values = np.array(rows), np.array(cols), np.array(values)
+
+    if np.issubdtype(out.dtype, np.integer):
+        if values.max() > np.iinfo(out.dtype).max:
+            raise OverflowError(f'Distances do not fit in {out.dtype}.')
+    if out.ndim == 1:
+        # Condensed output
+        out[condensed_offset(_worker['n'], rows, cols)] = values
+    else:
+        out[rows, cols] = values
+        out[cols, rows] = values
+    return len(values)
+# ---
+
+def parallel_distances(matrix_class, sequences, distance_fn, workers,
+                       names=None, tile_size=None, dtype=np.float64,
+                       path=None):
+    """A matrix with the distances between the sequences.
+
+    Args:
+        matrix_class: `DistanceMatrix` or `CondensedDistanceMatrix`.
+        sequences (sequence): The sequences, indexable by position.
+        distance_fn (callable): Distance between two sequences. It
+            must be picklable (e.g. a module level function).
+        workers (int): Number of processes.
+        names (sequence, optional): Names of the sequences.
+        tile_size (int, optional): Side of the tiles of pairs.
+        dtype (optional): Storage type of the entries.
+        path (str, optional): Map the matrix on this file (see 
+            `storage.create_memmap`), which the workers write to 
+            directly. By default, the matrix lives in shared memory.
+    """
+    n = len(sequences)
+    if tile_size is None:
+        tile_size = _tile_size(n, workers)
+
+    handles, block = [], None
+    try:
+        shared = _share_sequences(sequences)
+        if shared is not None:
+            shm, sequences = shared
+            handles.append(shm)
+        if path is not None:
+            matrix = matrix_class.zeros(n, names=names, dtype=dtype, 
+                                        path=path)
+            output = ('memmap', path)
+        else:
+            matrix, block = _shared_matrix(matrix_class, n, names, dtype)
+            output = block.description
+
+        with ProcessPoolExecutor(workers, initializer=_init_worker,
+                                 initargs=(sequences, output,
+                                           distance_fn)) as executor:
+            for _ in executor.map(_compute_tile, tiles(n, tile_size)):
+                pass
+    finally:
+        for shm in handles:
+            shm.close()
+            shm.unlink()
+        if block is not None:
+            # The matrix keeps the block mapped, it only loses its name
+            block.shm.unlink()
+    return matrix
+# ---
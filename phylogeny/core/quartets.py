@@ -0,0 +1,160 @@
+"""
+Compact storage of quartet trees.
+
+A quartet tree on the leaves {a,b,c,d} is one of the three
+splits ((a,b),(c,d)), ((a,c),(b,d)) or ((a,d),(b,c)). Instead of
+keeping each one as a nested tuple of names, a `QuartetStore`
+keeps the sorted indices of all the quartets in an (m x 4) int32
+array, and the split of each one as an int8 code (0, 1 or 2, in
+that order).
+
+Usage::
+
+    >>> store = QuartetStore([[0,1,2,3], [0,1,2,4]], codes=[0, 2],
+                             names='abcde')
+    >>> list(store)
+
+        [(('a', 'b'), ('c', 'd')), (('a', 'e'), ('b', 'c'))]
+
+    >>> list(store.without('d'))
+
+        [(('a', 'e'), ('b', 'c'))]
+"""
+
+import numpy as np
+from .fpc import _fpc_permutations
+
+# Column order of each split code: code -> (a,b,c,d) for ab|cd
+_SPLIT_COLUMNS = np.array(_fpc_permutations)
+
+
+class QuartetStore:
+    """Columnar container of quartet trees.
+
+    Attributes:
+        quartets (np.ndarray): (m x 4) int32 sorted indices of each quartet.
+        codes (np.ndarray): int8 code of the split of each quartet.
+        names (tuple, optional): Names of the indices.
+    """
+
+    def __init__(self, quartets, codes, names=None):
+        """
+        Args:
+            quartets (iterable): Sorted indices of each quartet.
+            codes (iterable): Code of the split of each quartet.
+            names (iterable, optional): Names of the indices.
+        """
+        self.quartets = np.asarray(quartets, dtype=np.int32).reshape(-1, 4)
+        self.codes = np.asarray(codes, dtype=np.int8).reshape(-1)
+        self.names = tuple(names) if names is not None else None
+        self._idx = None
+    # ---
+
+    @classmethod
+    def from_blocks(cls, blocks, names=None):
+        "Assemble from an iterable of ``(quartets, codes)`` blocks."
+        quartets, codes = [], []
+        for q, c in blocks:
+            quartets.append(np.asarray(q, dtype=np.int32))
+            codes.append(np.asarray(c, dtype=np.int8))
+        if not quartets:
+            return cls(np.empty((0,4)), [], names)
+        return cls(np.concatenate(quartets), np.concatenate(codes), names)
+    # ---
+
+    @classmethod
+    def from_tuples(cls, quartets):
+        "Build from quartet trees in the ((a,b),(c,d)) form."
+        # Index the names in order of appearance
+        names = list(dict.fromkeys(x for q in quartets 
+                                     for pair in q for x in pair))
+        idx = {name:i for i,name in enumerate(names)}
+
+        rows, codes = [], []
+        for ((a,b),(c,d)) in quartets:
+            a,b,c,d = idx[a], idx[b], idx[c], idx[d]
+            row = sorted((a,b,c,d))
+            # The code is given by the partner of the smallest index
+            first = row[0]
+            partner = {a:b, b:a, c:d, d:c}[first]
+            rows.append(row)
+            codes.append(row.index(partner) - 1)
+        return cls(rows, codes, names)
+    # ---
+
+    def __len__(self):
+        return len(self.codes)
+    # ---
+
+    def __repr__(self):
+        return (f"{self.__class__.__name__}(<{len(self)} quartets>, "
+                f"names={self.names})")
+    # ---
+
+    def __iter__(self):
+        "Iterate over the quartets in the ((a,b),(c,d)) form."
+        splits = self.splits()
+        names = self.names
+        for a,b,c,d in splits.tolist():
+            if names:
+                a,b,c,d = names[a], names[b], names[c], names[d]
+            yield ((a,b),(c,d))
+    # ---
+
+    def __getitem__(self, k):
+        "The k-th quartet in the ((a,b),(c,d)) form."
+        a,b,c,d = self.splits([k])[0].tolist()
+        if self.names:
+            a,b,c,d = (self.names[i] for i in (a,b,c,d))
+        return ((a,b),(c,d))
+    # ---
+
+    def splits(self, rows=slice(None)):
+        """The quartets arranged as splits.
+
+        Returns:
+            An (m x 4) array where each row (a,b,c,d) is the
+            split ((a,b),(c,d)).
+        """
+        quartets = self.quartets[rows]
+        columns = _SPLIT_COLUMNS[self.codes[rows]]
+        return np.take_along_axis(quartets, columns, axis=1)
+    # ---
+
+    def index_of(self, taxon):
+        "The index of a taxon given by name."
+        if self.names is None:
+            return taxon
+        if self._idx is None:
+            self._idx = {name:i for i,name in enumerate(self.names)}
+        return self._idx[taxon]
+    # ---
+
+    @property
+    def n_taxa(self):
+        "Size of the index space of the taxa."
+        if self.names is not None:
+            return len(self.names)
+        return int(self.quartets.max()) + 1 if len(self) else 0
+    # ---
+
+    def filter(self, mask):
+        "A new store with the quartets selected by the boolean mask."
+        return QuartetStore(self.quartets[mask], self.codes[mask], self.names)
+    # ---
+
+    def containing(self, taxon):
+        "Mask of the quartets containing the taxon."
+        return (self.quartets == self.index_of(taxon)).any(axis=1)
+    # ---
+
+    def with_taxon(self, taxon):
+        "A new store with only the quartets containing the taxon."
+        return self.filter(self.containing(taxon))
+    # ---
+
+    def without(self, taxon):
+        "A new store with the quartets not containing the taxon."
+        return self.filter(~self.containing(taxon))
+    # ---
+# --- QuartetStore
@@ -0,0 +1,478 @@
+"""
+Splits of trees as bitsets, and Robinson-Foulds distances.
+
+Each edge of a tree splits its leaves in two: the ones below
+the edge and the rest. Given an index of the leaf names shared by
+several trees, the leaves below each edge are a bitset, packed 64
+leaves per machine word like in `phylogeny.core.hamming`. Comparing
+trees is then comparing rows of words, which is done for all the
+edges at once instead of building sets of names.
+
+In a rooted tree the split of an edge is the clade below it. In an
+unrooted tree, the split is stored as the side that doesn't contain
+the first leaf of the index, so both sides of an edge give the same
+bitset.
+
+A `SplitSet` wraps the splits of a tree with the names of the leaves,
+and supports hashing and the operations of Python's sets.
+
+Usage::
+
+    >>> reference = Tree('((A,B),(C,(D,E)));')
+    >>> replicates = [Tree('((A,C),(B,(D,E)));'), reference.copy()]
+    >>> rf_distances(reference, replicates)
+
+        array([4, 0])
+
+    >>> splits = reference.splits()
+    >>> splits & replicates[0].splits()
+
+        SplitSet([{'D', 'E'}])
+"""
+
+import numpy as np
+from .arraytree import ArrayTree
+from .hamming import popcount
+
+
+def leaf_index(names):
+    "Map each leaf name to its bit."
+    index = {name:i for i,name in enumerate(names)}
+    if len(index) != len(names):
+        raise ValueError('Duplicated leaf names.')
+    return index
+# ---
+
+def as_array_tree(tree):
+    "An `ArrayTree` from a `Tree`, an `ArrayTree` or a newick string."
+    if isinstance(tree, ArrayTree):
+        return tree
+    if isinstance(tree, str):
+        return ArrayTree.from_newick(tree)
+    return ArrayTree.from_tree(tree)
+# ---
+
+def clade_bitsets(tree, index):
+    """The leaves below each node of the tree, as packed bitsets.
+
+    The bitsets are computed in a single bottom-up pass, OR'ing
+    all the nodes of a level into their parents at once.
+
+    Args:
+        tree (ArrayTree): The tree.
+        index (dict): The bit of each leaf name (see `leaf_index`).
+
+    Returns:
+        An (n_nodes x words) uint64 array, in the order of the ids
+        of the nodes.
+    """
+    n_words = max(1, (len(index) + 63) // 64)
+    bitsets = np.zeros((len(tree), n_words), dtype=np.uint64)
+
+    leaves = tree.leaves()
+    try:
+        bits = np.array([index[tree.names[i]] for i in leaves.tolist()],
+                        dtype=np.int64)
+    except KeyError as e:
+        raise ValueError(f'Leaf {e} is not in the leaf index.') from None
+    if len(np.unique(bits)) != len(bits):
+        raise ValueError('Duplicated leaf names.')
+    bitsets[leaves, bits // 64] = np.left_shift(np.uint64(1),
+                                                (bits % 64).astype(np.uint64))
+
+    # Merge the levels into their parents, the deepest first
+    order = tree.preorder()
+    parent = tree.parent
+    levels = np.zeros(len(tree), dtype=np.int64)
+    for node in order[1:].tolist():
+        levels[node] = levels[parent[node]] + 1
+    by_level = order[np.argsort(-levels[order], kind='stable')]
+    bounds = np.flatnonzero(np.diff(levels[by_level])) + 1
+    for nodes in np.split(by_level, bounds):
+        if levels[nodes[0]] == 0:
+            break
+        np.bitwise_or.at(bitsets, parent[nodes], bitsets[nodes])
+    return bitsets
+# ---
+
+def split_keys(bits):
+    "The rows of bitsets as single values that can be sorted and hashed."
+    bits = np.ascontiguousarray(bits, dtype=np.uint64)
+    return bits.view(np.dtype((np.void, 8*bits.shape[1]))).reshape(-1)
+# ---
+
+def _bits(keys, n_words):
+    "The inverse of `split_keys`."
+    return np.ascontiguousarray(keys).view(np.uint64).reshape(-1, n_words)
+# ---
+
+def unpack_splits(bits, n_leaves):
+    "A (splits x leaves) boolean array from packed bitsets."
+    states = np.unpackbits(np.ascontiguousarray(bits).view(np.uint8),
+                           axis=1, bitorder='little')
+    return states[:, :n_leaves].astype(bool)
+# ---
+
+def _pack(states):
+    "Packed bitsets from a (splits x leaves) boolean array."
+    n_words = max(1, (states.shape[1] + 63) // 64)
+    packed = np.zeros((len(states), 8*n_words), dtype=np.uint8)
+    packed[:, :(states.shape[1] + 7) // 8] = np.packbits(states, axis=1,
+                                                      bitorder='little')
+    return packed.view(np.uint64)
+# ---
+
+def _full_set(n_leaves):
+    "The bitset of all the leaves."
+    n_words = max(1, (n_leaves + 63) // 64)
+    full = np.zeros(n_words, dtype=np.uint64)
+    full[:n_leaves // 64] = np.iinfo(np.uint64).max
+    if n_leaves % 64:
+        full[n_leaves // 64] = (1 << (n_leaves % 64)) - 1
+    return full
+# ---
+
+def tree_splits(tree, index, unrooted=False):
+    """The distinct non-trivial splits of a tree, as sorted bitsets.
+
+    The trivial splits (a single leaf, or all the leaves) are shared
+    by any two trees on the same leaves, and are left out. So are,
+    when `unrooted`, the splits with a single leaf on either side.
+
+    Args:
+        tree: A `Tree`, an `ArrayTree` or a newick string.
+        index (dict): The bit of each leaf name (see `leaf_index`).
+        unrooted (bool, optional): Take the edges as bipartitions
+            instead of clades.
+
+    Returns:
+        An (m x words) uint64 array of the unique splits.
+    """
+    tree = as_array_tree(tree)
+    if tree.n_leaves != len(index):
+        raise ValueError('The tree is not on the leaves of the index.')
+    return canonical_splits(clade_bitsets(tree, index), len(index), unrooted)
+# ---
+
+def canonical_splits(bitsets, n_leaves, unrooted=False):
+    "The unique non-trivial splits of some clades (see `tree_splits`)."
+    bitsets = np.array(bitsets, dtype=np.uint64)
+    if unrooted:
+        # Keep the side without the first leaf
+        has_first = (bitsets[:, 0] & np.uint64(1)).astype(bool)
+        bitsets[has_first] ^= _full_set(n_leaves)
+
+    sizes = popcount(bitsets).sum(axis=1, dtype=np.int64)
+    largest = n_leaves-2 if unrooted else n_leaves-1
+    splits = bitsets[(sizes >= 2) & (sizes <= largest)]
+    return _bits(np.unique(split_keys(splits)), bitsets.shape[1])
+# ---
+
+def shared_splits(a, b):
+    "Number of splits in both arrays of unique splits."
+    if not len(a) or not len(b):
+        return 0
+    return len(np.intersect1d(split_keys(a), split_keys(b),
+                              assume_unique=True))
+# ---
+
+def _rf(reference, splits, normalized):
+    shared = shared_splits(reference, splits)
+    total = len(reference) + len(splits)
+    rf = total - 2*shared
+    if normalized:
+        return rf / total if rf else 0.0
+    return rf
+# ---
+
+# State of each worker process of `rf_distances`, set by `_init_rf_worker`
+_rf_worker = {}
+
+
+def _init_rf_worker(reference, index, unrooted, normalized):
+    "Give the worker the reference splits and the leaf index, once."
+    _rf_worker.update(reference=reference, index=index, unrooted=unrooted,
+                      normalized=normalized)
+# ---
+
+def _rf_task(tree):
+    "Process pool task: the RF distance of one tree to the reference."
+    splits = tree_splits(tree, _rf_worker['index'], _rf_worker['unrooted'])
+    return _rf(_rf_worker['reference'], splits, _rf_worker['normalized'])
+# ---
+
+def rf_distances(reference, trees, unrooted=False, normalized=False,
+                 workers=None):
+    """Robinson-Foulds distances from a reference to many trees.
+
+    The splits of the reference are computed once, over the index
+    of its leaves, and each tree is compared to them. The distances
+    are those of ete3's `compare` (its 'rf', or 'norm_rf' when
+    `normalized`), for trees on the same leaves.
+
+    Args:
+        reference: A `Tree`, an `ArrayTree` or a newick string.
+        trees (iterable): Trees on the same leaves, in any of the
+            forms of the reference.
+        unrooted (bool, optional): Compare the trees as unrooted.
+        normalized (bool, optional): Divide each distance by the
+            number of non-trivial splits of both trees.
+        workers (int, optional): Compare the trees in this many
+            processes. Newick strings are then parsed by the workers.
+
+    Returns:
+        An array with the distance of each tree.
+    """
+    reference = as_split_set(reference, unrooted=unrooted)
+    index = reference.index
+    ref_splits = reference.bits
+    dtype = np.float64 if normalized else np.int64
+
+    if workers:
+        from concurrent.futures import ProcessPoolExecutor
+        tasks = (tree if isinstance(tree, str) else as_array_tree(tree)
+                    for tree in trees)
+        with ProcessPoolExecutor(workers, initializer=_init_rf_worker,
+                                 initargs=(ref_splits, index, unrooted,
+                                           normalized)) as executor:
+            distances = list(executor.map(_rf_task, tasks, chunksize=16))
+    else:
+        distances = [_rf(ref_splits, split_bitsets(tree, index, unrooted),
+                         normalized)
+                        for tree in trees]
+    return np.array(distances, dtype=dtype)
+# ---
+
+def split_bitsets(tree, index, unrooted=False):
+    """The splits of a tree over an index, from its cache if it has one.
+
+    Like `tree_splits`, but the splits of a `Tree` or a `SplitSet`
+    are taken from their cache and reindexed.
+    """
+    if isinstance(tree, SplitSet) or hasattr(tree, 'splits'):
+        splits = as_split_set(tree, unrooted=unrooted)
+        if len(splits.names) != len(index):
+            raise ValueError('The tree is not on the leaves of the index.')
+        return splits.reindexed(list(index)).bits
+    return tree_splits(tree, index, unrooted)
+# ---
+
+def as_split_set(tree, unrooted=False):
+    """The `SplitSet` of a tree.
+
+    The splits of a `Tree` come from its cache (see `Tree.splits`).
+    """
+    if isinstance(tree, SplitSet):
+        if tree.unrooted != unrooted:
+            raise ValueError('The splits are not '
+                             + ('unrooted.' if unrooted else 'rooted.'))
+        return tree
+    if hasattr(tree, 'splits'):
+        return tree.splits(unrooted)
+    return SplitSet.from_tree(tree, unrooted=unrooted)
+# ---
+
+
+class SplitSet:
+    """The set of non-trivial splits of a tree.
+
+    The splits are kept as the rows of a sorted array of packed 
+    bitsets over the leaf names, `bits`. A split can be given to the 
+    methods as any iterable of leaf names, and the operations between 
+    two sets (``&``, ``|``, ``-``, ``^``, the comparisons and 
+    `rf_distance`) work on whole arrays. Sets with the leaves in 
+    different orders are reindexed to the order of the left one.
+    """
+
+    def __init__(self, bits, names, unrooted=False):
+        """
+        Args:
+            bits (array): The unique splits, as packed bitsets in the 
+                canonical form of `tree_splits`.
+            names (sequence): The name of the leaf of each bit.
+            unrooted (bool, optional): Whether the splits are 
+                bipartitions or clades.
+        """
+        self.names = tuple(names)
+        self.index = leaf_index(self.names)
+        self.unrooted = unrooted
+        n_words = max(1, (len(self.names) + 63) // 64)
+        self.bits = np.asarray(bits, dtype=np.uint64).reshape(-1, n_words)
+        self._hash = None
+    # ---
+
+    @classmethod
+    def from_tree(cls, tree, names=None, unrooted=False):
+        """The splits of a tree.
+
+        Args:
+            tree: A `Tree`, an `ArrayTree` or a newick string.
+            names (sequence, optional): The leaves, in the order of 
+                their bits. By default, the leaves of the tree in 
+                preorder.
+            unrooted (bool, optional): Take the edges as bipartitions.
+        """
+        tree = as_array_tree(tree)
+        if names is None:
+            names = tree.leaf_names()
+        return cls(tree_splits(tree, leaf_index(names), unrooted),
+                   names, unrooted)
+    # ---
+
+    def _new(self, bits):
+        return self.__class__(bits, self.names, self.unrooted)
+    # ---
+
+    def reindexed(self, names):
+        "The same splits with the bits in the order of the given names."
+        names = tuple(names)
+        if names == self.names:
+            return self
+        if set(names) != set(self.names):
+            raise ValueError('The splits are not on the same leaves.')
+        index = leaf_index(names)
+        states = np.zeros((len(self), len(names)), dtype=bool)
+        states[:, [index[name] for name in self.names]] = unpack_splits(
+                                                self.bits, len(self.names))
+        bits = canonical_splits(_pack(states), len(names), self.unrooted)
+        return self.__class__(bits, names, self.unrooted)
+    # ---
+
+    def _aligned(self, other):
+        "The bits of another set, over the leaves of this one."
+        if hasattr(other, 'splits'):
+            other = other.splits(self.unrooted)
+        elif not isinstance(other, SplitSet):
+            other = self.__class__.from_tree(other, self.names, self.unrooted)
+        if other.unrooted != self.unrooted:
+            raise ValueError('Rooted and unrooted splits are not comparable.')
+        return other.reindexed(self.names).bits
+    # ---
+
+    def bitset(self, leaves):
+        "The split of the given leaf names, in canonical form."
+        states = np.zeros((1, len(self.names)), dtype=bool)
+        states[0, [self.index[leaf] for leaf in leaves]] = True
+        bits = _pack(states)
+        if self.unrooted and states[0, 0]:
+            bits ^= _full_set(len(self.names))
+        return bits[0]
+    # ---
+
+    def leaves(self, i):
+        "The names of the leaves in the i-th split."
+        states = unpack_splits(self.bits[i:i+1], len(self.names))[0]
+        return frozenset(self.names[k] for k in np.flatnonzero(states))
+    # ---
+
+    def sizes(self):
+        "Number of leaves in each split."
+        return popcount(self.bits).sum(axis=1, dtype=np.int64)
+    # ---
+
+    def keys(self):
+        "Each split as a bytes object, to use as a key in a dict."
+        return [key.tobytes() for key in split_keys(self.bits)]
+    # ---
+
+    def __len__(self):
+        return len(self.bits)
+    # ---
+
+    def __iter__(self):
+        "The splits as frozensets of leaf names."
+        states = unpack_splits(self.bits, len(self.names))
+        for row in states:
+            yield frozenset(self.names[k] for k in np.flatnonzero(row))
+    # ---
+
+    def __contains__(self, leaves):
+        if isinstance(leaves, np.ndarray) and leaves.dtype == np.uint64:
+            bits = leaves
+        else:
+            try:
+                bits = self.bitset(leaves)
+            except KeyError:
+                return False
+        return bool((self.bits == bits).all(axis=1).any())
+    # ---
+
+    def __repr__(self):
+        splits = ', '.join('{' + ', '.join(map(repr, sorted(split, key=str))) 
+                           + '}' for split in self)
+        return f'{self.__class__.__name__}([{splits}])'
+    # ---
+
+    def __eq__(self, other):
+        if not isinstance(other, SplitSet):
+            return NotImplemented
+        return (    self.unrooted == other.unrooted 
+                and set(self.names) == set(other.names)
+                and np.array_equal(self.bits, self._aligned(other)))
+    # ---
+
+    def __hash__(self):
+        # Equal sets have the same bits over the sorted leaves
+        if self._hash is None:
+            canonical = self.reindexed(sorted(self.names, key=str))
+            self._hash = hash((canonical.names, self.unrooted,
+                               canonical.bits.tobytes()))
+        return self._hash
+    # ---
+
+    def _operation(self, other, operation):
+        if not isinstance(other, SplitSet):
+            return NotImplemented
+        keys = operation(split_keys(self.bits),
+                         split_keys(self._aligned(other)))
+        return self._new(_bits(keys, self.bits.shape[1]))
+    # ---
+
+    def __and__(self, other):
+        return self._operation(
+                    other, lambda a,b: np.intersect1d(a, b, assume_unique=True))
+    # ---
+
+    def __or__(self, other):
+        return self._operation(other, np.union1d)
+    # ---
+
+    def __sub__(self, other):
+        return self._operation(
+                    other, lambda a,b: np.setdiff1d(a, b, assume_unique=True))
+    # ---
+
+    def __xor__(self, other):
+        return self._operation(
+                    other, lambda a,b: np.setxor1d(a, b, assume_unique=True))
+    # ---
+
+    def __le__(self, other):
+        if not isinstance(other, SplitSet):
+            return NotImplemented
+        return self.issubset(other)
+    # ---
+
+    def __ge__(self, other):
+        if not isinstance(other, SplitSet):
+            return NotImplemented
+        return self.issuperset(other)
+    # ---
+
+    def issubset(self, other):
+        return len(self - other) == 0
+    # ---
+
+    def issuperset(self, other):
+        return len(other - self) == 0
+    # ---
+
+    def isdisjoint(self, other):
+        return len(self & other) == 0
+    # ---
+
+    def rf_distance(self, other, normalized=False):
+        "Robinson-Foulds distance to the splits of another tree."
+        return _rf(self.bits, self._aligned(other), normalized)
+    # ---
+# --- SplitSet
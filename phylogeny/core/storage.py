@@ -0,0 +1,153 @@
+"""
+On-disk distance matrices.
+
+A distance matrix can be stored in a file and mapped back into
+memory with `np.memmap`, so it can be computed once (e.g. with
+`DistanceMatrix.from_sequences`) and reused across processes and
+runs without recomputing it or loading it fully into RAM.
+
+The file has a small header followed by the raw entries::
+
+    b'PHYLODM\\0'            -- Magic string (8 bytes)
+    <header length>         -- Little-endian uint64
+    <JSON header>           -- Layout, size, dtype and names
+    <padding>               -- Up to a multiple of 64 bytes
+    <entries>               -- Dense (n x n) or condensed (n(n-1)/2)
+
+The names must be representable in JSON (strings or integers).
+The same kind of header, with another magic string, starts the
+packed alignment files of `phylogeny.core.alignment`.
+
+Usage::
+
+    # Compute the distances directly into a file
+    >>> distances = DistanceMatrix.from_sequences(sequences,
+                                                  path='distances.dm')
+
+    # ...and in another process
+    >>> distances = open_memmap('distances.dm')
+    >>> tree = infer_clocklike_tree2(distances)
+"""
+
+import json
+import numpy as np
+
+_MAGIC = b'PHYLODM\0'
+_ALIGNMENT = 64
+
+
+def _layout_of(matrix):
+    from .distance import CondensedDistanceMatrix
+    if isinstance(matrix, CondensedDistanceMatrix):
+        return 'condensed'
+    return 'dense'
+# ---
+
+def write_header(f, fields, magic=_MAGIC):
+    """Write the header of a new file and return the data offset.
+
+    The header is the magic string, the length of the JSON fields
+    and the fields, padded so the data that follows is aligned.
+
+    Args:
+        f: A binary file, open for writing at its start.
+        fields (dict): The fields of the header, representable in JSON.
+        magic (bytes, optional): The magic string of the file type.
+    """
+    header = json.dumps(fields).encode()
+    f.write(magic)
+    f.write(np.uint64(len(header)).tobytes())
+    f.write(header)
+    offset = f.tell() + (-f.tell()) % _ALIGNMENT
+    f.write(b'\0' * (offset - f.tell()))
+    return offset
+# ---
+
+def read_header(path, magic=_MAGIC, kind='distance matrix'):
+    """Read the header of a file and return it with the data offset.
+
+    Args:
+        path (str): The file.
+        magic (bytes, optional): The magic string of the file type.
+        kind (str, optional): The file type, for the error message.
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(magic)) != magic:
+            raise ValueError(f'{path} is not a {kind} file.')
+        length = int(np.frombuffer(f.read(8), dtype=np.uint64)[0])
+        header = json.loads(f.read(length).decode())
+    offset = len(magic) + 8 + length
+    offset += (-offset) % _ALIGNMENT
+    return header, offset
+# ---
+
+def _write_matrix_header(path, layout, names, dtype):
+    "Write the header of a new matrix file and return the data offset."
+    with open(path, 'wb') as f:
+        return write_header(f, {'layout': layout,
+                                'n': len(names),
+                                'dtype': np.dtype(dtype).str,
+                                'names': list(names)})
+# ---
+
+def _shape(layout, n):
+    if layout == 'condensed':
+        return (n*(n-1) // 2,)
+    return (n,n)
+# ---
+
+def _wrap(data, layout, names):
+    "Wrap the memory-mapped entries in the matrix class of the layout."
+    from .distance import DistanceMatrix, CondensedDistanceMatrix
+    if layout == 'condensed':
+        return CondensedDistanceMatrix(data, names=names)
+    return DistanceMatrix(data, names=names)
+# ---
+
+def create_memmap(path, names, dtype=np.float64, condensed=False):
+    """Create a zeroed matrix file and return the matrix mapped on it.
+
+    Args:
+        path (str): File to create (it will be overwritten).
+        names (iterable): Names of the nodes.
+        dtype (optional): Storage type of the entries.
+        condensed (bool, optional): Store only the upper triangle.
+    """
+    names = list(names)
+    layout = 'condensed' if condensed else 'dense'
+    offset = _write_matrix_header(path, layout, names, dtype)
+    data = np.memmap(path, dtype=dtype, mode='r+', offset=offset,
+                     shape=_shape(layout, len(names)))
+    return _wrap(data, layout, names)
+# ---
+
+def open_memmap(path, mode='r'):
+    """Map an existing matrix file into memory.
+
+    Args:
+        path (str): The matrix file.
+        mode (str, optional): As in `np.memmap`: 'r' (read-only),
+            'r+' (read and write) or 'c' (copy-on-write).
+    """
+    header, offset = read_header(path)
+    layout = header['layout']
+    data = np.memmap(path, dtype=np.dtype(header['dtype']), mode=mode,
+                     offset=offset, shape=_shape(layout, header['n']))
+    return _wrap(data, layout, header['names'])
+# ---
+
+def save_memmap(matrix, path):
+    "Write the matrix to a file that can be opened with `open_memmap`."
+    if not matrix.is_compact:
+        matrix = matrix.compact()
+    layout = _layout_of(matrix)
+    if layout == 'condensed':
+        entries = matrix.data
+    else:
+        entries = np.asarray(matrix)
+
+    offset = _write_matrix_header(path, layout, matrix.names, entries.dtype)
+    with open(path, 'r+b') as f:
+        f.seek(offset)
+        np.asarray(entries).tofile(f)
+# ---
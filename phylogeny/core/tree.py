@@ -2,8 +2,10 @@
 
 import ete3
 import numpy as np
-import itertools as itr
-from .distance import DistanceMatrix
+from .distance import DistanceMatrix, condensed_offset
+from .arraytree import ArrayTree
+from .splits import (rf_distances, clade_bitsets, canonical_splits, 
+                     leaf_index, SplitSet)
 
 class Tree(ete3.Tree):
     """Wrapper for the ETE Tree class adapted for the 
@@ -71,19 +73,73 @@ class Tree(ete3.Tree):
     def make_cherry_of(cls, a,b):
         "Get a cherry tree out of both items."
         cherry = cls()
-        cherry.add_child(name=a)
-        cherry.add_child(name=b)
+        leaf_a = cherry.add_child(name=a)
+        leaf_b = cherry.add_child(name=b)
+        cherry._name_index = {a: leaf_a, b: leaf_b}
+        leaf_a._indexed_by = leaf_b._indexed_by = cherry
         return cherry
     # ---
     
     @staticmethod
-    def replace_node(old, new):
+    def replace_node(old, new, tree=None):
+        """Put the node `new` in the place of `old`.
+        
+        If the `tree` containing them is given, its index of names 
+        is updated (see `node_of`).
+        """
         old_parent = old.up
         old.detach()
         old_parent.add_child(new)
+        
+        index = getattr(tree, '_name_index', None)
+        if index is not None:
+            for node in old.traverse():
+                if index.get(node.name) is node:
+                    del index[node.name]
+            for node in new.traverse():
+                if index.setdefault(node.name, node) is node:
+                    node._indexed_by = tree
         return new
     # ---
     
+    def node_of(self, name):
+        """The node with the given name.
+        
+        Instead of searching the whole tree like `search_nodes`, the 
+        nodes are looked up in an index of names, which `make_cherry_of`, 
+        `replace_node`, `add_as_sibling` and `prune_leaves` keep up to 
+        date. It's rebuilt when it's found stale (e.g. after the tree 
+        was changed with other ete3 methods).
+        
+        Each indexed node records the tree that indexed it, and loses 
+        the record when its subtree is detached, so a node that left 
+        the tree is found stale without walking up to its root.
+        """
+        index = getattr(self, '_name_index', None)
+        node = index.get(name) if index is not None else None
+        if (   node is None or node.name != name 
+            or getattr(node, '_indexed_by', None) is not self):
+            index = self.reindex()
+            node = index[name]
+        return node
+    # ---
+    
+    def reindex(self):
+        "Rebuild the index of names of `node_of`."
+        index = {}
+        for node in self.traverse():
+            if index.setdefault(node.name, node) is node:
+                node._indexed_by = self
+        self._name_index = index
+        return index
+    # ---
+    
+    def _leave_index(self):
+        "Drop the record of the index of this node and its descendants."
+        for node in self.traverse():
+            node._indexed_by = None
+    # ---
+    
     def show(self, mode=None, inline=False, styling=None, **kwargs):
         "Display the tree."
         
@@ -112,16 +168,18 @@ class Tree(ete3.Tree):
     def add_as_sibling(self, a, b):
         "Add leaf a as sibling of b in the tree."
         # Find the node corresponding to b and add a as sibling
-        b_node = self.search_nodes(name=b)[0]
+        b_node = self.node_of(b)
         # Make a new cherry out of a and b
         # and attach it in place of b
         cherry = self.make_cherry_of(a,b)
-        self.replace_node(b_node, cherry)
+        self.replace_node(b_node, cherry, self)
+        # Only the root keeps an index
+        cherry._name_index = None
     # ---
 
     def prune_leaves(self, to_stay):
         'Prune tree branches to leave only the leaves in `to_stay`.'
-        t = self.tree
+        t = self
         
         # Fetch leaf nodes with those names
         stay_nodes = set()
@@ -130,23 +188,158 @@ class Tree(ete3.Tree):
                 stay_nodes.add(leaf)
         
         t.prune(stay_nodes, preserve_branch_length=True)
+        # The pruned nodes leave the index
+        t._name_index = None
     # ---
     
-    def distance_matrix(self):
-        "Get the matrix of distances between each pair of leaves."
-        # Fetch the tree's leaves
-        leaves = self.get_leaves()
+    def distance_matrix(self, matrix_class=None, dtype=np.float64, 
+                        path=None):
+        """Get the matrix of distances between each pair of leaves.
+        
+        The leaves are taken in preorder, so the common ancestor of 
+        the leaves i < j is the shallowest of the common ancestors 
+        of the consecutive leaves between them. Each row of distances 
+        is then computed from the depths with a cumulative minimum, 
+        without walking up the tree for every pair.
+        
+        Args:
+            matrix_class (optional): `DistanceMatrix` (the default) 
+                or `CondensedDistanceMatrix`.
+            dtype, path (optional): As in the `zeros` of the class.
+        """
+        if matrix_class is None:
+            matrix_class = DistanceMatrix
+        tree = ArrayTree.from_tree(self)
+        depths = tree.depths()
+        order = tree.preorder()
+        is_leaf = tree.first_child[order] < 0
+        leaves = order[is_leaf]
         n = len(leaves)
-        # Get all pairs of leaves
-        pairs = itr.combinations(range(n), 2)
-        # Create an empty matrix
-        distances = DistanceMatrix.zeros(n, names=[l.name for l in leaves])
-        # Fill the distance matrix
-        for i,j in pairs:
-            d = self.get_distance(leaves[i],
-                                  leaves[j])
-            distances.set((leaves[i].name, leaves[j].name), d)
         
+        # Depth of the common ancestor of each pair of consecutive 
+        # leaves: the parent of the node visited after the first one
+        after = np.flatnonzero(is_leaf)[:-1] + 1
+        common = depths[tree.parent[order[after]]]
+        leaf_depths = depths[leaves]
+        
+        distances = matrix_class.zeros(n, names=[tree.names[i] for i in leaves],
+                                       dtype=dtype, path=path)
+        condensed = not isinstance(distances, DistanceMatrix)
+        for i in range(n-1):
+            ancestors = np.minimum.accumulate(common[i:])
+            row = leaf_depths[i] + leaf_depths[i+1:] - 2*ancestors
+            distances._check_fits(row)
+            if condensed:
+                offset = condensed_offset(n, i, i+1)
+                distances.data[offset:offset + n-i-1] = row
+            else:
+                distances[i, i+1:] = row
+                distances[i+1:, i] = row
         return distances
     # ---
+    
+    def splits(self, unrooted=False):
+        """The splits of the tree, as a `SplitSet`.
+        
+        The bitsets of all the edges are computed in one bottom-up 
+        pass, with the leaves in preorder, and cached. The cache is 
+        dropped when the tree changes through its methods (adding, 
+        removing, detaching or deleting nodes, rerooting...) or a 
+        leaf is renamed. After changing the `children` of a node by 
+        hand, call `invalidate_splits`.
+        
+        Args:
+            unrooted (bool, optional): Take the edges as bipartitions 
+                instead of clades.
+        """
+        cache = getattr(self, '_split_cache', None)
+        if cache is not None:
+            leaves, names, clades, splits = cache
+            if tuple(leaf.name for leaf in leaves) != names:
+                cache = None
+        if cache is None:
+            nodes = list(self.traverse('preorder'))
+            for node in nodes:
+                node._in_splits = True
+            leaves = [node for node in nodes if not node.children]
+            names = tuple(leaf.name for leaf in leaves)
+            clades = clade_bitsets(ArrayTree._from_nodes(nodes), 
+                                   leaf_index(names))
+            splits = {}
+            self._split_cache = (leaves, names, clades, splits)
+        
+        if unrooted not in splits:
+            splits[unrooted] = SplitSet(
+                            canonical_splits(clades, len(names), unrooted),
+                            names, unrooted)
+        return splits[unrooted]
+    # ---
+    
+    def invalidate_splits(self):
+        "Drop the cached splits of this node, its descendants and ancestors."
+        for node in self.traverse():
+            node._in_splits = False
+            node._split_cache = None
+        node = self.up
+        while node is not None:
+            node._in_splits = False
+            node._split_cache = None
+            node = node.up
+    # ---
+    
+    def _changed(self):
+        "Drop the cached splits made stale by a change in this node."
+        node = self
+        while node is not None and getattr(node, '_in_splits', False):
+            node._in_splits = False
+            node._split_cache = None
+            node = node.up
+    # ---
+    
+    def add_child(self, *args, **kwargs):
+        self._changed()
+        return super().add_child(*args, **kwargs)
+    # ---
+    
+    def remove_child(self, *args, **kwargs):
+        self._changed()
+        child = super().remove_child(*args, **kwargs)
+        Tree._leave_index(child)
+        return child
+    # ---
+    
+    def detach(self):
+        if self.up is not None:
+            Tree._changed(self.up)
+            Tree._leave_index(self)
+        return super().detach()
+    # ---
+    
+    def set_outgroup(self, *args, **kwargs):
+        self.invalidate_splits()
+        return super().set_outgroup(*args, **kwargs)
+    # ---
+    
+    def resolve_polytomy(self, *args, **kwargs):
+        self.invalidate_splits()
+        return super().resolve_polytomy(*args, **kwargs)
+    # ---
+    
+    def rf_distance(self, tree, unrooted=False, normalized=False):
+        """Robinson-Foulds distance to a tree on the same leaves.
+        
+        Like the 'rf' (or 'norm_rf') of `compare`, but the splits 
+        are compared as bitsets (see `splits.rf_distances`).
+        """
+        return rf_distances(self, [tree], unrooted, normalized)[0].item()
+    # ---
+    
+    def rf_distances(self, trees, unrooted=False, normalized=False, 
+                     workers=None):
+        """Robinson-Foulds distances to many trees on the same leaves.
+        
+        See `splits.rf_distances`.
+        """
+        return rf_distances(self, trees, unrooted, normalized, workers)
+    # ---
 # --- Tree
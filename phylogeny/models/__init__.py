@@ -1 +1 @@
-from .cfn import CFN_Tree
+from .cfn import CFN_Tree, random_cfn_tree, cfn_distances
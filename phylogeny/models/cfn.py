@@ -39,11 +39,12 @@ The CFN model in words from the book:
 """
 
 import math
-import random as rnd
-import itertools as itr
 import numpy as np
-from collections import defaultdict
-from ..core import Tree
+from ..core import Tree, ArrayTree
+from ..core.distance import (DistanceMatrix, CondensedDistanceMatrix,
+                             as_distance_matrix)
+from ..core.hamming import pack_bits
+from ..core.alignment import write_alignment
 
 
 def swap(binary):
@@ -53,9 +54,14 @@ def swap(binary):
         return 1
 # ---
 
-def random_test(probability):
-    'Return True with a given probability, otherwise return False.'
-    return (rnd.random() < probability)
+def random_test(probability, rng=None):
+    """Return True with a given probability, otherwise return False.
+    
+    Args:
+        rng (optional): A `numpy.random.Generator`, or a seed for one.
+    """
+    rng = np.random.default_rng(rng)
+    return bool(rng.random() < probability)
 # ---
 
 
@@ -101,8 +107,41 @@ class CFN_Tree(Tree):
                5: [1, 1, 1, 1, 1], 
                6: [1, 1, 1, 1, 1] }
     
+        # Reproducible trees and traits
+        >>> cfn = CFN_Tree(leaves=5, seed=42)
+        >>> sequences = cfn.evolve_traits([1,1,1,1,1])
+    
     """
     
+    def __init__(self, *args, seed=None, **kwargs):
+        """
+        Args:
+            leaves (int, optional): Populate randomly with this number 
+                of leaves. It can also be given as the first argument.
+            seed (optional): Seed of the random streams of the tree, 
+                an int, a `SeedSequence` or a `Generator`.
+        """
+        if args and isinstance(args[0], int):
+            kwargs['leaves'], args = args[0], args[1:]
+        # Set before populating in the parent constructor
+        self._seed = seed
+        self._seed_sequence = None
+        super().__init__(*args, **kwargs)
+    # ---
+    
+    def _next_seed(self, seed=None):
+        """The seed of the next random stream.
+        
+        Unless it's given, each call spawns a new independent 
+        stream from the seed of the tree.
+        """
+        if seed is not None:
+            return as_seed_sequence(seed)
+        if self._seed_sequence is None:
+            self._seed_sequence = as_seed_sequence(self._seed)
+        return self._seed_sequence.spawn(1)[0]
+    # ---
+    
     @staticmethod
     def cfn_metric(probability):
         "Return the length of an edge with the given probability."
@@ -118,54 +157,441 @@ class CFN_Tree(Tree):
                 + self.get_ascii(show_internal=True) )
     # ---
     
-    def populate(self, n):
-        'Populate the tree with nodes and change probabilities.'
-        # Populate the usual way
-        super().populate(n)
-        # Change names and add probabilities
-        for i,node in enumerate(self.traverse()):
-            node.name = i
-            if i > 0:
-                # Add a change probability < 0.5
-                p = rnd.random() / 2
-                node.add_feature('probability', p)
-                # The probability in the model is associated to the edge 
-                # (branch), in this implementation, we associate the 
-                # probability to the node downstream of the edge.
-                
-                # Add the distance from the previous node 
-                node.dist = self.cfn_metric(p)
-                # The 'CNF model distance' is an additive
-                # metric representing the average n
-            else:
-                # No probability of change before this
-                node.add_feature('probability', 0)
+    def populate(self, n, seed=None):
+        """Populate the tree with nodes and change probabilities.
+        
+        Args:
+            n (int): Number of leaves.
+            seed (optional): Seed of the random tree, as in `CFN_Tree`.
+        """
+        rng = np.random.default_rng(self._next_seed(seed))
+        parent, probabilities = _random_cfn_arrays(n, rng)
+        
+        # The nodes are named by the order in which they branch
+        self.name = 0
+        # No probability of change before this
+        self.add_feature('probability', 0)
+        nodes = [self]
+        for i in range(1, len(parent)):
+            # The probability in the model is associated to the edge 
+            # (branch), in this implementation, we associate the 
+            # probability to the node downstream of the edge.
+            p = float(probabilities[i])
+            
+            # Add the distance from the previous node 
+            node = nodes[parent[i]].add_child(name=i, 
+                                              dist=self.cfn_metric(p))
+            # The 'CNF model distance' is an additive
+            # metric representing the average n
+            node.add_feature('probability', p)
+            nodes.append(node)
     # ---        
     
-    def evolve_traits(self, traits):
-        "Evolve the binary traits through the tree."
-        # The sequences generated
-        sequences = defaultdict(list)
-        for leaf in self.iter_leaves():
-            path_from_root = list(reversed(leaf.get_ancestors()))
-            path_from_root.append(leaf)
-            # Evolve each trait
-            for trait in traits:
-                # Follow path stochastically 
-                final_trait = self.trait_traverse(path_from_root, trait)
-                # Save character's final state
-                sequences[leaf.name].append(final_trait)
-        return dict(sequences)
+    def evolve_traits(self, traits, seed=None, workers=None):
+        """Evolve the binary traits through the tree.
+        
+        Args:
+            traits (iterable): The states of the traits at the root.
+            seed (optional): Seed of the simulation, as in `CFN_Tree`.
+            workers (int, optional): Processes used to simulate.
+        
+        Returns:
+            A dict with the sequence of each leaf.
+        """
+        names, states = simulate_traits(self, root_states=traits,
+                                        seed=self._next_seed(seed),
+                                        workers=workers)
+        return {name:row.tolist() for name,row in zip(names, states)}
+    # ---
+    
+    def simulate_blocks(self, n_traits, packed=True, seed=None, 
+                        block_sites=None):
+        """Evolve random traits through the tree in blocks of sites.
+        
+        See `simulate_blocks`.
+        """
+        return simulate_blocks(self, n_traits, packed=packed,
+                               seed=self._next_seed(seed), 
+                               block_sites=block_sites)
+    # ---
+    
+    def write_traits(self, path, n_traits, format='packed', seed=None, 
+                     block_sites=None):
+        """Evolve random traits through the tree and stream them to a file.
+        
+        The traits are simulated and written one block of sites at a 
+        time, so they can be many more than fit in memory. The file 
+        can be read back block by block with 
+        `phylogeny.core.alignment.read_alignment_blocks`.
+        
+        Args:
+            path (str): File to create.
+            n_traits (int): Number of traits.
+            format (str, optional): 'packed', 'phylip' or 'fasta'.
+            seed, block_sites (optional): As in `simulate_blocks`.
+        """
+        names, blocks = self.simulate_blocks(n_traits, seed=seed,
+                                             block_sites=block_sites)
+        write_alignment(path, names, n_traits, blocks, format=format)
     # ---
             
-    def trait_traverse(self, path_from_root, init):
-        # Follow path stochastically 
+    def trait_traverse(self, path_from_root, init, seed=None):
+        """Follow the path from the root stochastically.
+        
+        Args:
+            path_from_root (iterable): The nodes of the path.
+            init: The state of the trait at the root.
+            seed (optional): Seed of the changes, as in `CFN_Tree`.
+        
+        Returns:
+            The final state of the trait.
+        """
+        rng = np.random.default_rng(self._next_seed(seed))
         trait = init
         for node in path_from_root: 
             probability = node.probability
-            if random_test(probability):
+            if random_test(probability, rng):
                 trait = swap(trait)
         # Return character's final state
         return trait
     # ---
 # --- CFN_Tree
+
+def as_seed_sequence(seed=None):
+    """A `SeedSequence` from a seed.
+    
+    Args:
+        seed (optional): None (fresh entropy), an int, a 
+            `SeedSequence` (returned as is) or a `Generator` 
+            (which draws the entropy).
+    """
+    if isinstance(seed, np.random.SeedSequence):
+        return seed
+    if isinstance(seed, np.random.Generator):
+        return np.random.SeedSequence(int(seed.integers(1 << 63)))
+    return np.random.SeedSequence(seed)
+# ---
+
+def _random_cfn_arrays(n_leaves, rng):
+    "The parents and change probabilities of a random CFN tree."
+    n_nodes = max(1, 2*n_leaves - 1)
+    parent = np.full(n_nodes, -1, dtype=np.int32)
+    
+    # Split a random leaf until there are enough leaves
+    leaves = [0]
+    size = 1
+    for k in rng.integers(0, np.arange(1, n_leaves)).tolist():
+        node = leaves[k]
+        parent[size:size+2] = node
+        leaves[k] = size
+        leaves.append(size + 1)
+        size += 2
+    
+    probabilities = rng.random(n_nodes) / 2
+    probabilities[0] = 0
+    return parent, probabilities
+# ---
+
+def random_cfn_tree(n_leaves, seed=None):
+    """A random CFN model tree, built directly as an `ArrayTree`.
+    
+    Branches randomly like `CFN_Tree.populate`, but without a 
+    Python object per node. The nodes are named by their id, and 
+    the branch lengths are the `CFN_Tree.cfn_metric` of change 
+    probabilities drawn uniformly from [0, 0.5).
+    
+    Args:
+        n_leaves (int): Number of leaves.
+        seed (optional): An int, a `SeedSequence` or a `Generator`.
+    """
+    rng = np.random.default_rng(seed)
+    parent, probabilities = _random_cfn_arrays(n_leaves, rng)
+    dist = -np.log(1 - 2*probabilities) / 2
+    return ArrayTree(parent, dist, names=range(len(parent)))
+# ---
+
+def cfn_distances(data, names=None, n_sites=None, cap=None):
+    """CFN-corrected distances, computed in bulk.
+    
+    The proportion p of sites that differ between two sequences 
+    is turned into the additive CFN distance -ln(1 - 2p)/2 (see 
+    `CFN_Tree.cfn_metric`) for all the pairs at once. The pairs 
+    that look saturated (p >= 0.5), for which the distance is not 
+    defined, get the `cap` instead.
+    
+    Args:
+        data: A dict of binary sequences by name, or a distance 
+            matrix (`DistanceMatrix`, `CondensedDistanceMatrix` or 
+            a square array) of Hamming counts or proportions.
+        names (optional): Names of the taxa, for a plain array.
+        n_sites (int, optional): Number of sites, when the matrix 
+            holds Hamming counts instead of proportions.
+        cap (float, optional): Distance of the saturated pairs. By 
+            default, twice the largest of the other distances.
+    
+    Returns:
+        A float64 matrix of the same kind as the input (a 
+        `DistanceMatrix` for sequences).
+    """
+    if isinstance(data, dict):
+        names = list(data)
+        n_sites = len(next(iter(data.values()))) if data else 0
+        data = DistanceMatrix.from_sequences(data)
+    data = as_distance_matrix(data, names, compact=True)
+    
+    condensed = isinstance(data, CondensedDistanceMatrix)
+    p = np.array(data.data if condensed else data, dtype=np.float64)
+    if n_sites is not None:
+        p /= max(1, n_sites)
+    
+    saturated = p >= 0.5
+    with np.errstate(divide='ignore', invalid='ignore'):
+        distances = -np.log1p(-2*p) / 2
+    if saturated.any():
+        if cap is None:
+            finite = distances[~saturated]
+            cap = 2*finite.max() if finite.size and finite.max() > 0 else 1.0
+        distances[saturated] = cap
+    
+    if condensed:
+        return CondensedDistanceMatrix(distances, names=data.names)
+    np.fill_diagonal(distances, 0)
+    return DistanceMatrix(distances, names=data.names)
+# ---
+
+# Bits of precision of the change probabilities
+_FLIP_BITS = 32
+
+# Words of sites simulated at a time
+_SIMULATION_WORDS = 1 << 14
+
+
+def cfn_probabilities(tree):
+    """The change probability of the branch above each node.
+    
+    Returns:
+        The tree as an `ArrayTree` and the array of probabilities 
+        of its nodes. For an `ArrayTree` they are given by the 
+        branch lengths (the inverse of `CFN_Tree.cfn_metric`).
+    """
+    if isinstance(tree, ArrayTree):
+        probabilities = (1 - np.exp(-2*tree.dist)) / 2
+    else:
+        nodes = list(tree.traverse('preorder'))
+        probabilities = np.array([getattr(node, 'probability', None) 
+                                     for node in nodes], dtype=float)
+        tree = ArrayTree.from_tree(tree)
+        # Nodes without a probability use their branch length
+        missing = np.isnan(probabilities)
+        probabilities[missing] = (1 - np.exp(-2*tree.dist[missing])) / 2
+    probabilities[tree.root] = 0
+    return tree, probabilities
+# ---
+
+def bernoulli_words(rng, probability, n_words):
+    """Random 64-bit words whose bits are set with the given probability.
+    
+    Builds the bits from the binary expansion of the probability: 
+    going from its least to its most significant bit, the words are 
+    OR'ed with random words for each 1, and AND'ed for each 0. This 
+    takes `_FLIP_BITS` random words at most, instead of a random 
+    number per bit.
+    """
+    words = np.zeros(n_words, dtype=np.uint64)
+    bits = int(round(probability * (1 << _FLIP_BITS)))
+    if bits >= 1 << _FLIP_BITS:
+        words[:] = np.iinfo(np.uint64).max
+        return words
+    
+    # The trailing zeros would only AND the zero words
+    n_bits = _FLIP_BITS
+    while bits and not bits & 1:
+        bits >>= 1
+        n_bits -= 1
+    for _ in range(n_bits):
+        random = rng.bit_generator.random_raw(n_words)
+        if bits & 1:
+            np.bitwise_or(words, random, out=words)
+        else:
+            np.bitwise_and(words, random, out=words)
+        bits >>= 1
+    return words
+# ---
+
+def _chunk_seeds(seed_sequence):
+    """The seeds of the chunks of sites, in order.
+    
+    They are spawned from a copy of the seed sequence, so the k-th 
+    chunk always gets the same seed, whatever was spawned from the 
+    seed sequence before.
+    """
+    fresh = np.random.SeedSequence(seed_sequence.entropy,
+                                   spawn_key=seed_sequence.spawn_key)
+    while True:
+        yield fresh.spawn(1)[0]
+# ---
+
+def _simulate_chunk(plan, chunk_seed, start, stop, root_words=None):
+    """Simulate the words [start, stop) of the traits of the leaves.
+    
+    The random stream of the chunk only depends on its own seed 
+    (see `_chunk_seeds`), so the chunks can be simulated in any 
+    order or process.
+    """
+    order, parent, is_last, is_leaf, rows, probabilities, valid = plan
+    rng = np.random.default_rng(chunk_seed)
+    valid = valid[start:stop]
+    if root_words is not None:
+        root = root_words[start:stop].copy()
+    else:
+        root = rng.bit_generator.random_raw(stop - start)
+    
+    states = np.zeros((len(rows), stop - start), dtype=np.uint64)
+    pending = {order[0]: root & valid}
+    for node in order[1:]:
+        flips = bernoulli_words(rng, probabilities[node], stop - start)
+        state = (pending[parent[node]] ^ flips) & valid
+        if is_last[node]:
+            # All the children of the parent are done
+            del pending[parent[node]]
+        if is_leaf[node]:
+            states[rows[node]] = state
+        else:
+            pending[node] = state
+    if is_leaf[order[0]]:
+        states[rows[order[0]]] = pending[order[0]]
+    return states
+# ---
+
+def _simulation_plan(tree, n_traits=None, root_states=None):
+    """What `_simulate_chunk` needs to know of the tree and traits.
+    
+    Returns:
+        The names of the leaves, the plan, the number of traits 
+        and the packed root states (or None, if they are random).
+    """
+    tree, probabilities = cfn_probabilities(tree)
+    
+    root_words = None
+    if root_states is not None:
+        root_states = np.asarray(list(root_states), dtype=np.uint8)
+        n_traits = len(root_states)
+        root_words = pack_bits(root_states[None, :])[0]
+    # Mask of the words that are actual sites
+    valid = pack_bits(np.ones((1, n_traits)))[0]
+    
+    leaves = tree.leaves().tolist()
+    plan = (tree.preorder().tolist(), 
+            tree.parent.tolist(),
+            (tree.next_sibling < 0).tolist(),
+            (tree.first_child < 0).tolist(),
+            {node:k for k,node in enumerate(leaves)},
+            probabilities.tolist(),
+            valid)
+    names = [tree.names[node] for node in leaves]
+    return names, plan, n_traits, root_words
+# ---
+
+def simulate_traits(tree, n_traits=None, root_states=None, packed=False,
+                    seed=None, workers=None):
+    """Evolve binary traits down a tree under the CFN model.
+    
+    The tree is traversed once in preorder. Each edge draws a 
+    mask of changes for all the traits at once, which is XOR'ed 
+    into the states of the parent. Only the states of the nodes 
+    whose children are pending are kept.
+    
+    The traits are simulated in chunks of `_SIMULATION_WORDS` words, 
+    each one with its own random stream spawned from the seed, so 
+    the result is the same whether the chunks are simulated serially 
+    or by several processes.
+    
+    Args:
+        tree: A `CFN_Tree`, or an `ArrayTree` whose branch lengths 
+            are the CFN metric of the change probabilities.
+        n_traits (int, optional): Number of traits, with uniformly 
+            random states at the root.
+        root_states (iterable, optional): The 0/1 states of the 
+            traits at the root, instead of `n_traits`.
+        packed (bool, optional): Return the states packed in 
+            64-bit words, as in `phylogeny.core.hamming`.
+        seed (optional): An int, a `SeedSequence` or a `Generator`.
+        workers (int, optional): Simulate the chunks in this many 
+            processes.
+    
+    Returns:
+        The names of the leaves and an (n_leaves x n_traits) uint8 
+        array of their states (or (n_leaves x words) uint64 when
+        packed).
+    """
+    seed_sequence = as_seed_sequence(seed)
+    names, plan, n_traits, root_words = _simulation_plan(tree, n_traits, 
+                                                         root_states)
+    n_words = (n_traits + 63) // 64
+    
+    chunks = [(start, min(n_words, start + _SIMULATION_WORDS), chunk_seed)
+                 for start, chunk_seed in zip(range(0, n_words, 
+                                                    _SIMULATION_WORDS),
+                                              _chunk_seeds(seed_sequence))]
+    states = np.zeros((len(names), n_words), dtype=np.uint64)
+    if workers and len(chunks) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(workers) as executor:
+            futures = [executor.submit(_simulate_chunk, plan, chunk_seed,
+                                       start, stop, root_words)
+                          for start, stop, chunk_seed in chunks]
+            for (start, stop, _), future in zip(chunks, futures):
+                states[:, start:stop] = future.result()
+    else:
+        for start, stop, chunk_seed in chunks:
+            states[:, start:stop] = _simulate_chunk(plan, chunk_seed,
+                                                    start, stop, root_words)
+    
+    if packed:
+        return names, states
+    unpacked = np.unpackbits(states.view(np.uint8), axis=1)
+    return names, unpacked[:, :n_traits]
+# ---
+
+def simulate_blocks(tree, n_traits=None, root_states=None, packed=True,
+                    seed=None, block_sites=None):
+    """Evolve binary traits down a tree in blocks of sites.
+    
+    Like `simulate_traits`, but the traits are generated lazily, 
+    one block of sites at a time, so the memory used is bounded by 
+    the size of a block. With the default block size, the traits 
+    are the same as those of `simulate_traits` with the same seed.
+    
+    Args:
+        tree, n_traits, root_states, packed, seed: As in 
+            `simulate_traits`.
+        block_sites (int, optional): Sites per block, a multiple 
+            of 64.
+    
+    Returns:
+        The names of the leaves and a generator of the blocks 
+        ``(start, stop, block)`` of the sites ``start:stop``, as 
+        read by `phylogeny.core.alignment.write_alignment`.
+    """
+    block_words = (block_sites or 64*_SIMULATION_WORDS) // 64
+    if block_words < 1 or (block_sites or 0) % 64:
+        raise ValueError('The sites per block must be a multiple of 64.')
+    seed_sequence = as_seed_sequence(seed)
+    names, plan, n_traits, root_words = _simulation_plan(tree, n_traits, 
+                                                         root_states)
+    n_words = (n_traits + 63) // 64
+    
+    def blocks():
+        for start, chunk_seed in zip(range(0, n_words, block_words),
+                                     _chunk_seeds(seed_sequence)):
+            stop = min(n_words, start + block_words)
+            block = _simulate_chunk(plan, chunk_seed, start, stop, 
+                                    root_words)
+            first, last = 64*start, min(n_traits, 64*stop)
+            if not packed:
+                block = np.unpackbits(block.view(np.uint8), axis=1)
+                block = block[:, :last - first]
+            yield first, last, block
+    
+    return names, blocks()
+# ---
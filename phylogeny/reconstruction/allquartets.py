@@ -14,9 +14,13 @@ we use in Step 2 is called the “All Quartets Method”.
 
 """
 
-import itertools as itr
+import heapq
+import numpy as np
 from ..core import Tree
-from ..core.fpc import fpc_sums
+from ..core.distance import as_distance_matrix
+from ..core.quartets import QuartetStore
+from ..core.fpc import (fpc_sums, fpc_sums_block, quartet_blocks, 
+                        _fpc_permutations)
 
 
 def induced_quartet(dist_matrix, idx_quartet=None):
@@ -33,6 +37,35 @@ def induced_quartet(dist_matrix, idx_quartet=None):
     return quartet
 # ---
 
+def induced_quartet_codes(dist_matrix, quartets):
+    """Get the induced quartet topologies of a block of quartets.
+    
+    For each row (a,b,c,d) of the (m x 4) array of indices, return 
+    the code of the split with the smallest sum: 0 for ((a,b),(c,d)), 
+    1 for ((a,c),(b,d)) and 2 for ((a,d),(b,c)). Ties are broken 
+    like in `induced_quartet`.
+    """
+    sums = fpc_sums_block(dist_matrix, quartets)
+    return np.argmin(sums, axis=1).astype(np.int8)
+# ---
+
+def quartet_of_code(idx_quartet, code):
+    "The split ((a,b),(c,d)) of a quartet of indices, given its code."
+    q = tuple(int(i) for i in idx_quartet)
+    i,j,k,l = _fpc_permutations[code]
+    return ((q[i],q[j]), (q[k],q[l]))
+# ---
+
+def induced_quartets(dist_matrix):
+    """Induced quartets of indices of all the quartets of the matrix.
+    
+    Yields blocks ``(quartets, codes)`` of the (m x 4) array of 
+    indices and their codes (see `induced_quartet_codes`).
+    """
+    for quartets in quartet_blocks(len(dist_matrix)):
+        yield quartets, induced_quartet_codes(dist_matrix, quartets)
+# ---
+
 def map_names_to_quartet(quartet, names=None):
     "Map the names to the quartet's indices."
     if names:
@@ -58,6 +91,7 @@ def four_point_method(additive, names=None):
             names = additive.names
         except AttributeError:
             pass
+    additive = as_distance_matrix(additive, compact=True)
     
     # Calculate the quartet inferred by the distances
     quartet = induced_quartet(additive)
@@ -72,19 +106,20 @@ def four_point_method(additive, names=None):
 # ---
 
 def all_quartets(dist_matrix, names=None):
-    "Get all inferred quartet subtrees."
+    """Get all inferred quartet subtrees.
+    
+    Returns:
+        A `QuartetStore`. Iterating over it gives the quartets
+        in the ((a,b),(c,d)) form.
+    """
     if names is None:
         try:
             names = dist_matrix.names
         except AttributeError:
             pass
+    dist_matrix = as_distance_matrix(dist_matrix, compact=True)
     
-    n = len(dist_matrix)
-    quartets = itr.combinations(range(n), 4)
-    
-    return [map_names_to_quartet(induced_quartet(dist_matrix,q), 
-                                 names)
-             for q in quartets]
+    return QuartetStore.from_blocks(induced_quartets(dist_matrix), names)
 # ---
 
 def infer_siblings(quartets):
@@ -95,7 +130,13 @@ def infer_siblings(quartets):
     (In other words, for all a,b, any quartet on {x,y,a,b} 
     is ((x,y),(a,b))). Any pair of leaves that are siblings 
     in the quartets tree T will satisfy this property.
+    
+    The quartets can be a `QuartetStore` or a sequence of
+    quartets in the ((a,b),(c,d)) form.
     """
+    if isinstance(quartets, QuartetStore):
+        return _infer_siblings_store(quartets)
+    
     together = set()
     separated = set()
     
@@ -112,25 +153,160 @@ def infer_siblings(quartets):
     return {frozenset(pair) for pair in together - separated}
 # ---
 
-def tree_from_quartets(quartets):
-    "From the given quartets, assemble the tree."
-    if len(quartets) == 1:
-        q = quartets[0]
-        return Tree.from_quartet(q)
-    else:
-        # Fetch a pair of sibling leafs
-        a,b = list(infer_siblings(quartets).pop())
-            
-        # Recourse in quartets \ {a}
-        new_quartets = [q for q in quartets if (a not in q[0]) and (a not in q[-1])]
-        tree = tree_from_quartets(new_quartets)
+def _infer_siblings_store(store):
+    "Vectorized `infer_siblings` over a `QuartetStore`."
+    n = store.n_taxa
+    a,b,c,d = store.splits().T.astype(np.int64)
+    
+    def pair_keys(x, y):
+        return np.minimum(x,y)*n + np.maximum(x,y)
+    
+    together = np.concatenate([pair_keys(a,b), pair_keys(c,d)])
+    separated = np.concatenate([pair_keys(a,c), pair_keys(a,d),
+                                pair_keys(b,c), pair_keys(b,d)])
+    siblings = np.setdiff1d(together, separated)
+    
+    names = store.names or range(n)
+    return {frozenset((names[k // n], names[k % n])) 
+               for k in siblings.tolist()}
+# ---
+
+class IncrementalSiblings:
+    """Incremental version of `infer_siblings` for `tree_from_quartets`.
+    
+    Keeps, for every pair of taxa, how many of the remaining 
+    quartets have them together and how many separated, in n×n 
+    arrays. Removing a taxon only subtracts the counts of the 
+    quartets containing it (found through an inverted index), 
+    and the pairs that become never separated are pushed as 
+    candidate siblings, so no rescan of the quartets is needed.
+    
+    Works on the indices of the taxa of a `QuartetStore`.
+    """
+    
+    def __init__(self, store):
+        self.n = n = store.n_taxa
+        self.splits = splits = store.splits()
+        self.alive = np.ones(len(splits), dtype=bool)
+        self.remaining = len(splits)
+        
+        # Pair counts over all the quartets
+        self.together = np.zeros(n*n, dtype=np.int64)
+        self.separated = np.zeros(n*n, dtype=np.int64)
+        for start in range(0, len(splits), self._block):
+            self._count(splits[start:start + self._block], +1)
+        
+        # Inverted index: the quartets of each taxon
+        order = np.argsort(splits.ravel(), kind='stable')
+        self._rows = order // 4
+        self._offsets = np.concatenate(
+            [[0], np.cumsum(np.bincount(splits.ravel(), minlength=n))])
+        
+        # Initial candidates: together, but never separated
+        self.removed = np.zeros(n, dtype=bool)
+        self._candidates = np.flatnonzero(  (self.together > 0) 
+                                          & (self.separated == 0)).tolist()
+        heapq.heapify(self._candidates)
+    # ---
+    
+    _block = 1 << 16 # Quartets counted at a time
+    
+    def _pair_keys(self, splits):
+        "Keys of the together (m×2) and separated (m×4) pairs of the splits."
+        n = self.n
+        a,b,c,d = splits.T.astype(np.int64)
+        
+        def keys(x, y):
+            return np.minimum(x,y)*n + np.maximum(x,y)
+        
+        together = np.stack([keys(a,b), keys(c,d)], axis=1)
+        separated = np.stack([keys(a,c), keys(a,d), 
+                              keys(b,c), keys(b,d)], axis=1)
+        return together, separated
+    # ---
+    
+    def _count(self, splits, sign):
+        "Add (or subtract) the pair counts of the splits."
+        together, separated = self._pair_keys(splits)
+        size = self.n * self.n
+        self.together += sign*np.bincount(together.ravel(), minlength=size)
+        self.separated += sign*np.bincount(separated.ravel(), minlength=size)
+        return separated
+    # ---
+    
+    def _is_sibling(self, key):
+        i,j = divmod(key, self.n)
+        return (    not self.removed[i] and not self.removed[j]
+                and self.together[key] > 0 and self.separated[key] == 0)
+    # ---
+    
+    def siblings(self):
+        "A pair of sibling taxa among the remaining quartets."
+        # Discard the candidates invalidated by removals
+        while not self._is_sibling(self._candidates[0]):
+            heapq.heappop(self._candidates)
+        return divmod(self._candidates[0], self.n)
+    # ---
+    
+    def last_quartet(self):
+        "The split (a,b,c,d) of the first remaining quartet."
+        return tuple(self.splits[np.argmax(self.alive)].tolist())
+    # ---
+    
+    def remove(self, taxon):
+        "Remove the quartets containing the taxon (an index)."
+        rows = self._rows[self._offsets[taxon]:self._offsets[taxon+1]]
+        rows = rows[self.alive[rows]]
+        self.alive[rows] = False
+        self.remaining -= len(rows)
+        self.removed[taxon] = True
+        
+        # Subtract the counts of those quartets
+        separated = self._count(self.splits[rows], -1)
         
-        # Add a as sibling of b
-        tree.add_as_sibling(a,b)
-        return tree
+        # The pairs that might no longer be separated
+        changed = np.unique(separated)
+        for key in changed[self.separated[changed] == 0].tolist():
+            if self._is_sibling(key):
+                heapq.heappush(self._candidates, key)
+    # ---
+# --- IncrementalSiblings
+
+def tree_from_quartets(quartets, tree_class=Tree):
+    """From the given quartets, assemble the tree.
+    
+    The quartets can be a `QuartetStore` or a sequence of
+    quartets in the ((a,b),(c,d)) form. The pairs of siblings
+    are found with `IncrementalSiblings`. The tree is built as
+    a `tree_class`, `Tree` or `ArrayTree`.
+    
+    Instead of recursing on the quartets without 'a' for each
+    pair of siblings (a,b), the pairs are recorded while the 
+    taxa are removed, and then replayed on the last quartet.
+    """
+    if not isinstance(quartets, QuartetStore):
+        quartets = QuartetStore.from_tuples(quartets)
+    names = quartets.names or range(quartets.n_taxa)
+    siblings = IncrementalSiblings(quartets)
+    
+    decisions = []
+    while siblings.remaining > 1:
+        # Fetch a pair of sibling leafs
+        a,b = siblings.siblings()
+        # Continue in quartets \ {a}
+        siblings.remove(a)
+        decisions.append((a,b))
+    
+    a,b,c,d = (names[i] for i in siblings.last_quartet())
+    tree = tree_class.from_quartet(((a,b),(c,d)))
+    
+    # Add each a as sibling of its b, the last removed first
+    for a,b in reversed(decisions):
+        tree.add_as_sibling(names[a], names[b])
+    return tree
 # ---
 
-def all_quartets_method(dist_matrix, names=None):
+def all_quartets_method(dist_matrix, names=None, tree_class=Tree):
     "Reconstruct the tree from the dist. matrix using the all quartets method."
     if names is None:
         try:
@@ -138,5 +314,5 @@ def all_quartets_method(dist_matrix, names=None):
         except AttributeError:
             pass
     quartets = all_quartets(dist_matrix, names)
-    return tree_from_quartets(quartets)
+    return tree_from_quartets(quartets, tree_class)
 # ---
\ No newline at end of file
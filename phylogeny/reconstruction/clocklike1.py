@@ -108,103 +108,158 @@ Algorithm description:
 
 '''
 
-import networkx as nx
-from ..core import Tree 
+from math import ulp
+import numpy as np
+from ..core import Tree, ArrayTree
+from ..core.distance import as_distance_matrix
 
 
-def infer_clocklike_tree1(ultrametric, node_names=None):
+def infer_clocklike_tree1(ultrametric, node_names=None, tree_class=Tree):
+    """Infer the tree of an ultrametric matrix.
+    
+    Args:
+        ultrametric: A distance matrix or a square array.
+        node_names (optional): Names of the nodes.
+        tree_class (optional): The class of the result, `Tree` 
+            or `ArrayTree`.
+    """
     if node_names is None:
         try:
             node_names = ultrametric.names
         except AttributeError:
             node_names = tuple(range(len(ultrametric)))
+    ultrametric = as_distance_matrix(ultrametric, compact=True)
         
-    g = get_graph(ultrametric, node_names)
-    P = get_path(g, ultrametric, node_names)
-    t = path_to_tree(P)
-    t.standardize()
-    
-    return t
+    order, weights = get_path(ultrametric)
+    return path_to_tree([node_names[i] for i in order], weights, tree_class)
 # ---
 
-def get_graph(ultrametric, nodes):
-    "From an ultrametric matrix, get the weights graph."
-    
-    n = len(nodes) # Matrix dimensions
-    g = nx.Graph()
+def get_path(ultrametric, start=0):
+    """From the ultrametric matrix, get the path.
     
-    # Add nodes
-    g.add_nodes_from(nodes)
+    The graph of the matrix is never built: the indices of the
+    nodes not yet in the path are kept in an array, and at each 
+    step only the row of the current node is read.
     
-    # Add edge weights
-    for i in range(n):
-        for j in range(i+1, n):
-            g.add_edge(nodes[i], nodes[j], weight=ultrametric[i][j])
-            
-    return g
-# ---
-
-def get_path(g, ultrametric, nodes):
-    "From the weights graph, get the path."
-    weight = weights_for(ultrametric, nodes)
+    Returns:
+        The indices of the nodes in the order of the path, and 
+        the weights of the n-1 edges between consecutive nodes.
+    """
+    n = len(ultrametric)
+    order = np.empty(n, dtype=np.int64)
+    # The weights keep the type of the distances
+    weights = np.empty(max(0, n-1), dtype=ultrametric.dtype)
     
-    N = set(nodes)
-    L = nx.Graph()
-    i = N.pop()
-
-    while(N):
-        # Find a node j in N for which D(i,j) is max
-        j,w = min([(node, weight(i, node)) for node in N],
-                  key=(lambda x:x[-1]))
+    # N: the nodes not yet in the path
+    N = np.delete(np.arange(n), start)
+    i = order[0] = start
+    for step in range(1, n):
+        # Find a node j in N for which D(i,j) is min
+        distances = np.asarray(ultrametric.row(i))[N]
+        k = np.argmin(distances)
+        j = N[k]
         # Place (i,j) in path L
-        L.add_edge(i,j, weight=w)
-        
+        order[step], weights[step-1] = j, distances[k]
+        # Remove j from N, swapping the last node into its place
+        N[k] = N[-1]
+        N = N[:-1]
         i = j
-        N.remove(j)
         
-    return L
+    return order, weights
 # ---
 
-def path_to_tree(P):    
-    tree = Tree()
+# Units in the last place that float weights may differ by and tie
+_TIE_ULPS = 4
+
+def _same_weight(a, b, exact):
+    """Are the weights equal? 
     
-    if len(P.edges) <= 1:
-        # Edge case
-        for v in P.nodes:
-            tree.add_child(name=v)
-    else:
-        # Remove the edge with the maximum weight
-        P = P.copy()
-        edge, weight = max_edge_weight(P)
-        P.remove_edge(*edge)
-        
-        # Do the same to the remaining subpaths
-        for c in nx.connected_components(P):
-            component = P.subgraph(c).copy()
-            tree.add_child(path_to_tree(component))
-            
-    return tree
+    Unless they are `exact` (integers), they may differ by a few 
+    units in the last place, from rounding.
+    """
+    if exact:
+        return a == b
+    return abs(a - b) <= _TIE_ULPS * ulp(max(abs(a), abs(b)))
 # ---
 
-def weights_for(matrix, nodes):
-    "Get the entries by node name."
-    # Translate node names to indices
-    to_indices = {node:i for i,node in enumerate(nodes)}
+def path_to_tree(nodes, weights, tree_class=Tree):
+    """Assemble the ultrametric tree of a path.
     
-    def weight_fn(a,b):
-        return matrix[to_indices[a]][to_indices[b]]
+    Instead of removing the max weight edges and recursing on 
+    the subpaths, the tree is built in a single sweep over the 
+    path, as the Cartesian tree of the edge weights. A stack 
+    keeps the internal nodes of the rightmost branch of the tree 
+    built so far, with strictly decreasing heights. The k edges 
+    tied for the same weight share a single internal node with 
+    k+1 children. Integer weights tie when they are equal, and 
+    float weights when they only differ by rounding.
     
-    return weight_fn
-# ---
-
-def max_edge_weight(L):
-    "Return the edge with the largest weight."
-    return max([(edge,weight) for *edge,weight in L.edges.data('weight')],
-               key=lambda x: x[-1])
+    The height of the internal node of an edge of weight w is w/2, 
+    and the branch lengths are the differences of heights.
+    
+    Args:
+        nodes (sequence): Names of the nodes in the order of the path.
+        weights (sequence): Weights of the edges between consecutive
+            nodes.
+        tree_class (optional): `Tree` or `ArrayTree`.
+    """
+    n = len(nodes)
+    # The leaves are the first n ids, the internal nodes follow
+    parent = np.full(2*n, -1, dtype=np.int32)
+    height = np.zeros(2*n)
+    size = n
+    
+    if n == 1:
+        # Edge case
+        parent[0], size = 1, 2
+    
+    weights = np.asarray(weights)
+    exact = not np.issubdtype(weights.dtype, np.inexact)
+    stack = [] # (weight, internal node)
+    node = 0
+    for k, w in enumerate(weights.tolist()):
+        # Close the subtrees below the edge
+        while (    stack and stack[-1][0] < w 
+               and not _same_weight(stack[-1][0], w, exact)):
+            parent[node] = node = stack.pop()[1]
+        
+        if stack and _same_weight(stack[-1][0], w, exact):
+            # A tie: the subpath hangs from the same node
+            parent[node] = stack[-1][1]
+        else:
+            parent[node] = size
+            height[size] = w/2
+            stack.append((w, size))
+            size += 1
+        node = k + 1
+    
+    # Close the rightmost branch
+    while stack:
+        parent[node] = node = stack.pop()[1]
+    
+    parent, height = parent[:size], height[:size]
+    dist = np.where(parent >= 0, height[parent] - height, 0)
+    names = list(nodes) + [None]*(size-n)
+    if issubclass(tree_class, ArrayTree):
+        return tree_class(parent, dist, names)
+    
+    # Link the nodes directly, the children in the order of the path
+    tree_nodes = [tree_class() for _ in range(size)]
+    for node, name in enumerate(names[:n]):
+        tree_nodes[node].name = name
+    root = None
+    for node, (p, d) in enumerate(zip(parent.tolist(), dist.tolist())):
+        if p < 0:
+            root = tree_nodes[node]
+            root.dist = 0.0
+        else:
+            tree_nodes[p].add_child(tree_nodes[node], dist=d)
+    return root
 # ---
 
 def draw_graph(g):
     "Display an edge-weighted graph."
+    import networkx as nx
     labels = nx.get_edge_attributes(g,'weight')
     nx.draw_networkx_edge_labels(g,
                                  nx.circular_layout(g),
@@ -16,10 +16,67 @@ has properties that make it “ultrametric”."
     -- From the book: "Computational Phylogenetics. An introduction 
        to designing methods for phylogeny estimation" by Tandy Warnow
 """
-from ..core import DistanceMatrix, Tree
+import numpy as np
+from ..core import Tree
+from ..core.distance import as_distance_matrix
 
 
-def infer_clocklike_tree2(distances):
+class NearestNeighbours:
+    """Cache of the nearest neighbour of each row of a distance matrix.
+    
+    For every live row i, keeps the closest live entry j after it 
+    (in storage order), so the closest pair of the whole matrix is 
+    the cached pair with the smallest distance. Ties are broken as 
+    in `DistanceMatrix.closest_pair`: the first pair in row order.
+    
+    As the distances don't change when an entry is removed, only
+    the rows whose nearest neighbour was that entry are refreshed.
+    """
+    
+    def __init__(self, matrix):
+        """
+        Args:
+            matrix: A `DistanceMatrix` or `CondensedDistanceMatrix`,
+                whose entries are removed with `discard`.
+        """
+        self.matrix = matrix
+        n = len(matrix.active)
+        self.nearest = np.full(n, -1)
+        self.distance = np.full(n, np.inf)
+        for i in matrix.live_indices():
+            self._refresh(i)
+    # ---
+    
+    def _refresh(self, i):
+        "Recompute the nearest neighbour of the i-th row."
+        later = np.flatnonzero(self.matrix.active[i+1:]) + (i+1)
+        if len(later) == 0:
+            self.nearest[i], self.distance[i] = -1, np.inf
+            return
+        row = self.matrix.row(i)[later]
+        k = np.argmin(row)
+        self.nearest[i], self.distance[i] = later[k], row[k]
+    # ---
+    
+    def closest_pair(self):
+        "The positions of the closest pair of entries, and their distance."
+        i = int(np.argmin(self.distance))
+        return (i, int(self.nearest[i])), self.distance[i]
+    # ---
+    
+    def discard(self, name):
+        "Remove the named entry from the matrix and update the cache."
+        i = self.matrix.idx[name]
+        self.matrix.discard(name)
+        self.nearest[i], self.distance[i] = -1, np.inf
+        for row in np.flatnonzero(self.nearest == i):
+            self._refresh(row)
+    # ---
+# --- NearestNeighbours
+
+
+def infer_clocklike_tree2(distances, names=None, method='cache', 
+                          tree_class=Tree):
     """Assumming the sequences evolved in a clocklike process, 
     infer the tree.
     
@@ -42,18 +99,47 @@ def infer_clocklike_tree2(distances):
     sibling to 'b'."
     
         -- From the book.
+    
+    Args:
+        distances: A `DistanceMatrix`, `CondensedDistanceMatrix`
+            or a square array of distances.
+        names (optional): Names of the taxa, when `distances` 
+            is a plain array.
+        method (str, optional): How the closest pair is found at 
+            each step: 'cache' keeps the `NearestNeighbours` of each 
+            row, 'scan' looks at every pair. Both give the same tree.
+        tree_class (optional): The class of the result, `Tree` 
+            or `ArrayTree`.
     """
-    if len(distances) == 2:
-        # Return a cherry tree
-        cherry = Tree.make_cherry_of(*distances.names)
-        return cherry
-    else:
+    distances = as_distance_matrix(distances, names)
+    
+    # Instead of recursing, record the pairs (a,b) while
+    # removing the a's from a single working matrix
+    working = distances.shallow_copy()
+    if method == 'cache':
+        neighbours = NearestNeighbours(working)
+    elif method != 'scan':
+        raise ValueError(f"Unknown method: {method!r}")
+    
+    storage_names = dict(zip(working.idx.values(), working.idx))
+    decisions = []
+    while len(working.idx) > 2:
         # Find closest taxa a,b in S
-        (a,b), _ = min(distances.name_all(), key=lambda item: item[-1])
-        # Recurse on (sequences \ a)
-        chopped = distances.remove(a)
-        tree = infer_clocklike_tree2(chopped)
-        # Find the node corresponding to b and add a as sibling
+        if method == 'cache':
+            (i,j), _ = neighbours.closest_pair()
+            a,b = storage_names[i], storage_names[j]
+            # Continue on (sequences \ a)
+            neighbours.discard(a)
+        else:
+            (a,b), _ = working.closest_pair()
+            working.discard(a)
+        decisions.append((a,b))
+    
+    # Start from a cherry tree
+    tree = tree_class.make_cherry_of(*working.names)
+    
+    # Add each a as sibling of its b, the last removed first
+    for a,b in reversed(decisions):
         tree.add_as_sibling(a, b)
-        return tree
+    return tree
 # ---
\ No newline at end of file
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+from phylogeny.models import CFN_Tree
+from phylogeny.models.cfn import simulate_blocks, simulate_traits
+from phylogeny.core.alignment import (read_alignment_blocks, 
+                                      read_alignment_names)
+from phylogeny.core.storage import read_header
+
+
+def test_simulated_blocks():
+    t = CFN_Tree(leaves=10, seed=1)
+    names, expected = simulate_traits(t, 1_000, seed=2)
+    
+    # The blocks are the same traits...
+    names, blocks = simulate_blocks(t, 1_000, packed=False, seed=2)
+    blocks = list(blocks)
+    assert [(start, stop) for start, stop, _ in blocks] == [(0, 1_000)]
+    assert (blocks[0][-1] == expected).all()
+    
+    # ...and smaller blocks also cover all of them
+    names, blocks = simulate_blocks(t, 1_000, packed=False, seed=2, 
+                                    block_sites=256)
+    states = np.concatenate([block for _, _, block in blocks], axis=1)
+    assert states.shape == (10, 1_000)
+# ---
+
+@pytest.mark.parametrize('format', ['packed', 'phylip', 'fasta'])
+def test_streamed_file(tmp_path, format):
+    t = CFN_Tree(leaves=10, seed=1)
+    path = str(tmp_path / f'traits.{format}')
+    t.write_traits(path, 1_000, format=format, seed=3, block_sites=256)
+    
+    names, blocks = t.simulate_blocks(1_000, packed=False, seed=3, 
+                                      block_sites=256)
+    expected = np.concatenate([block for _, _, block in blocks], axis=1)
+    
+    # The integer names only round-trip in the packed format
+    if format == 'packed':
+        assert read_alignment_names(path, format) == names
+    else:
+        assert read_alignment_names(path, format) == [str(n) for n in names]
+    blocks = list(read_alignment_blocks(path, format, block_sites=256))
+    assert [start for start, _, _ in blocks] == [0, 256, 512, 768]
+    states = np.concatenate([block for _, _, block in blocks], axis=1)
+    assert (states == expected).all()
+# ---
+
+def test_packed_header(tmp_path):
+    t = CFN_Tree(leaves=4, seed=1)
+    path = str(tmp_path / 'traits.packed')
+    t.write_traits(path, 100, seed=3)
+    
+    # The header is the one of the matrix files, with its own magic
+    with pytest.raises(ValueError):
+        read_header(path)
+    names = read_alignment_names(path)
+    assert all(isinstance(name, int) for name in names)
+    assert names == t.simulate_blocks(100)[0]
+# ---
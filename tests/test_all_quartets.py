@@ -0,0 +1,64 @@
+import itertools as itr
+from phylogeny import Tree, DistanceMatrix
+from phylogeny.reconstruction import all_quartets_method
+from phylogeny.reconstruction.allquartets import (all_quartets, induced_quartet, 
+                                                  map_names_to_quartet,
+                                                  infer_siblings, 
+                                                  tree_from_quartets,
+                                                  IncrementalSiblings)
+from phylogeny.core.quartets import QuartetStore
+
+# An unrooted tree with branch lengths...
+real = Tree('((A:1,B:2):1,(C:3,(D:1,E:2):2):1,(F:2,G:1):3);')
+# ...and its additive matrix
+matrix = real.distance_matrix()
+
+
+def test_batched_quartets():
+    n = len(matrix)
+    expected = [map_names_to_quartet(induced_quartet(matrix, q), matrix.names)
+                   for q in itr.combinations(range(n), 4)]
+    
+    # Same quartets, in the same order, as one by one
+    assert list(all_quartets(matrix)) == expected
+# ---
+
+def test_all_quartets_method():
+    rec = all_quartets_method(matrix)
+    
+    assert set(rec.get_leaf_names()) == set(matrix.names)
+    assert real.compare(rec, unrooted=True)['rf'] == 0
+# ---
+
+def test_quartet_store():
+    store = all_quartets(matrix)
+    legacy = list(store)
+    
+    # Round trip through the legacy form
+    assert list(QuartetStore.from_tuples(legacy)) == legacy
+    
+    # Filtering by taxon
+    assert list(store.without('A')) == [q for q in legacy 
+                                          if 'A' not in q[0] + q[1]]
+    assert len(store.with_taxon('A')) + len(store.without('A')) == len(store)
+    
+    # The store and the legacy list give the same results
+    assert infer_siblings(store) == infer_siblings(legacy)
+    assert tree_from_quartets(legacy).compare(tree_from_quartets(store), 
+                                              unrooted=True)['rf'] == 0
+# ---
+
+def test_incremental_siblings():
+    store = all_quartets(matrix)
+    siblings = IncrementalSiblings(store)
+    
+    # Each step agrees with a full rescan of the remaining quartets
+    while siblings.remaining > 1:
+        a,b = siblings.siblings()
+        pair = frozenset((store.names[a], store.names[b]))
+        assert pair in infer_siblings(store)
+        
+        siblings.remove(a)
+        store = store.without(store.names[a])
+        assert siblings.remaining == len(store)
+# ---
@@ -0,0 +1,80 @@
+import pytest
+from phylogeny import Tree, ArrayTree
+from phylogeny.models import random_cfn_tree
+from phylogeny.reconstruction import (all_quartets_method,
+                                      infer_clocklike_tree1,
+                                      infer_clocklike_tree2)
+from phylogeny.reconstruction.clocklike1 import path_to_tree
+
+newick = '((A:1,B:2):1,(C:3,(D:1,E:2):2):1,(F:2,G:1):3);'
+
+
+def test_newick():
+    t = ArrayTree.from_newick(newick)
+
+    assert len(t) == 12
+    assert t.leaf_names() == list('ABCDEFG')
+    assert t.write() == newick
+    assert ArrayTree.from_newick(t.write()).write() == newick
+# ---
+
+def test_tree_conversion():
+    real = Tree(newick)
+    t = ArrayTree.from_tree(real)
+
+    assert t.leaf_names() == real.get_leaf_names()
+    assert real.compare(t.to_tree(), unrooted=True)['rf'] == 0
+
+    # The branch lengths are kept
+    back = t.to_tree()
+    assert back.get_distance('A', 'E') == real.get_distance('A', 'E')
+
+    depths = t.depths()
+    assert depths[t.node_of('E')] == real.get_distance(real, 'E')
+# ---
+
+def test_add_as_sibling():
+    t = ArrayTree.from_quartet((('A','B'),('C','D')))
+    real = Tree.from_quartet((('A','B'),('C','D')))
+    for a,b in [('E','A'), ('F','D'), ('G','E')]:
+        t.add_as_sibling(a, b)
+        real.add_as_sibling(a, b)
+
+    assert real.compare(t.to_tree())['rf'] == 0
+    assert t.leaf_names() == list('AEGBCDF')
+
+    # The root has no siblings
+    t = ArrayTree.from_newick('(A:1,B:1)R;')
+    with pytest.raises(ValueError):
+        t.add_as_sibling('C', 'R')
+    assert t.write() == '(A:1,B:1)R;'
+# ---
+
+def test_path_to_tree():
+    nodes, weights = list('ABCDE'), [2, 6, 4, 6]
+
+    t = path_to_tree(nodes, weights)
+    assert isinstance(t, Tree)
+    array = path_to_tree(nodes, weights, tree_class=ArrayTree)
+    assert isinstance(array, ArrayTree)
+
+    # Both are the same tree
+    assert t.write() == array.to_tree().write()
+    assert sorted(t.get_leaf_names()) == nodes
+    assert t.get_distance('A', 'E') == 6
+# ---
+
+def test_reconstruction():
+    clocklike = random_cfn_tree(30).to_tree()
+    clocklike.convert_to_ultrametric()
+    distances = clocklike.distance_matrix()
+
+    for infer in (infer_clocklike_tree1, infer_clocklike_tree2):
+        rec = infer(distances, tree_class=ArrayTree)
+        assert isinstance(rec, ArrayTree)
+        assert clocklike.compare(rec.to_tree())['rf'] == 0
+
+    additive = Tree(newick)
+    rec = all_quartets_method(additive.distance_matrix(), tree_class=ArrayTree)
+    assert additive.compare(rec.to_tree(), unrooted=True)['rf'] == 0
+# ---
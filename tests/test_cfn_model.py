@@ -32,3 +32,83 @@ def test_evolve_traits():
     # The sequences must be binary
     for seq in sequences.values():
         assert set(seq) ^ {1,0} == set()
+
+def test_simulate_traits():
+    import numpy as np
+    from phylogeny import ArrayTree
+    from phylogeny.core.hamming import pack_bits
+    from phylogeny.models.cfn import simulate_traits, random_cfn_tree
+    n_leaves = 50
+    n = 1_000
+    
+    t = random_cfn_tree(n_leaves)
+    names, states = simulate_traits(t, n)
+    
+    assert states.shape == (n_leaves, n)
+    assert names == t.leaf_names()
+    assert set(np.unique(states)) <= {0,1}
+    
+    # The packed states are those of `pack_bits`
+    names, packed = simulate_traits(t, root_states=[1]*n, packed=True)
+    assert packed.shape == (n_leaves, (n + 63) // 64)
+    assert (pack_bits(np.unpackbits(packed.view(np.uint8), 
+                                    axis=1)[:, :n]) == packed).all()
+    
+    # Each edge changes the state with its probability
+    p = np.array([0, 0.1, 0.3])
+    cherry = ArrayTree([-1,0,0], dist=-np.log(1 - 2*p)/2, names='rab')
+    names, states = simulate_traits(cherry, root_states=[0]*100_000)
+    assert np.allclose(states.mean(axis=1), p[1:], atol=0.01)
+# ---
+
+def test_reproducible_simulation(monkeypatch):
+    import numpy as np
+    from phylogeny.models import cfn
+    
+    # The same seed gives the same tree and traits
+    a, b = CFN_Tree(leaves=20, seed=42), CFN_Tree(leaves=20, seed=42)
+    assert a.write(features=['probability']) == b.write(features=['probability'])
+    assert a.evolve_traits([1]*100) == b.evolve_traits([1]*100)
+    
+    # ...and another seed, other traits
+    assert a.evolve_traits([1]*100) != b.evolve_traits([1]*100, seed=1)
+    
+    # The single trait traversals take a seed too
+    path = a.get_leaves()[0].get_ancestors()[::-1]
+    assert ([a.trait_traverse(path, 1, seed=k) for k in range(20)] 
+            == [b.trait_traverse(path, 1, seed=k) for k in range(20)])
+    
+    # The chunks simulated in parallel give the serial result
+    monkeypatch.setattr(cfn, '_SIMULATION_WORDS', 4)
+    t = cfn.random_cfn_tree(20, seed=np.random.default_rng(1))
+    _, serial = cfn.simulate_traits(t, 1_000, seed=7)
+    _, parallel = cfn.simulate_traits(t, 1_000, seed=7, workers=2)
+    assert (serial == parallel).all()
+# ---
+
+def test_cfn_distances():
+    import numpy as np
+    from phylogeny import ArrayTree, CondensedDistanceMatrix
+    from phylogeny.models import cfn_distances
+    from phylogeny.models.cfn import simulate_traits
+    from phylogeny.reconstruction import all_quartets_method
+    
+    real = ArrayTree.from_newick('((A:0.1,B:0.2):0.1,(C:0.15,(D:0.1,E:0.2)'
+                                 ':0.1):0.1,(F:0.2,G:0.1):0.15);').to_tree()
+    names, states = simulate_traits(real, 20_000, seed=1)
+    
+    # The corrected distances estimate the additive ones...
+    distances = cfn_distances(dict(zip(names, states)))
+    assert np.allclose(distances, real.distance_matrix(), atol=0.05)
+    # ...and are ready for the all quartets method
+    rec = all_quartets_method(distances)
+    assert real.compare(rec, unrooted=True)['rf'] == 0
+    
+    # From Hamming counts, with a cap for the saturated pairs
+    counts = CondensedDistanceMatrix([[0, 10, 60],
+                                      [10, 0, 50],
+                                      [60, 50, 0]], names='abc')
+    corrected = cfn_distances(counts, n_sites=100, cap=9)
+    assert isinstance(corrected, CondensedDistanceMatrix)
+    assert np.allclose(corrected.data, [-np.log(0.8)/2, 9, 9])
+# ---
@@ -35,3 +35,88 @@ def test_infer_clocklike_tree2():
     
     assert real.compare(rec)['rf'] == 0
 # ---
+
+def test_condensed_input():
+    from phylogeny import CondensedDistanceMatrix
+    condensed = CondensedDistanceMatrix(matrix, names=nodes)
+    
+    for infer in (infer_clocklike_tree1, infer_clocklike_tree2):
+        rec = infer(condensed)
+        assert real.compare(rec)['rf'] == 0
+# ---
+
+def test_memmap_input(tmp_path):
+    from phylogeny import DistanceMatrix
+    from phylogeny.reconstruction import all_quartets_method
+    path = str(tmp_path / 'ultrametric.dm')
+    DistanceMatrix(matrix, names=nodes).save(path)
+    
+    for infer in (infer_clocklike_tree1, infer_clocklike_tree2):
+        rec = infer(DistanceMatrix.open(path))
+        assert real.compare(rec)['rf'] == 0
+    
+    rec = all_quartets_method(DistanceMatrix.open(path))
+    assert real.compare(rec, unrooted=True)['rf'] == 0
+# ---
+
+def test_no_recursion_limit():
+    import sys
+    n_leaves = 500
+    
+    clocklike = Tree()
+    clocklike.populate(n_leaves, random_branches=True)
+    clocklike.convert_to_ultrametric()
+    distances = clocklike.distance_matrix()
+    
+    # The reconstruction must not recurse once per taxon
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(200)
+    try:
+        rec = infer_clocklike_tree2(distances)
+    finally:
+        sys.setrecursionlimit(limit)
+    
+    assert clocklike.compare(rec)['rf'] == 0
+# ---
+
+def test_nearest_neighbours_ties():
+    import numpy as np
+    from phylogeny import DistanceMatrix
+    
+    # Few distinct distances, so there are lots of ties
+    rng = np.random.default_rng(0)
+    x = rng.integers(1, 4, (40,40))
+    distances = DistanceMatrix(x + x.T)
+    
+    cached = infer_clocklike_tree2(distances, method='cache')
+    scanned = infer_clocklike_tree2(distances, method='scan')
+    assert cached.write(format=9) == scanned.write(format=9)
+# ---
+
+def test_path_to_tree():
+    from phylogeny.reconstruction.clocklike1 import path_to_tree
+    
+    # The merge heights are the branch lengths
+    rec = infer_clocklike_tree1(matrix, nodes)
+    for i,a in enumerate(nodes):
+        for j,b in enumerate(nodes):
+            if i != j:
+                assert rec.get_distance(a, b) == matrix[i][j]
+    
+    # The tied max weight edges give a single node with 3 children
+    rec = path_to_tree(['A', 'B', 'C', 'D'], [4, 2, 4])
+    assert len(rec.children) == 3
+    assert rec.get_distance('B', 'C') == 2
+    assert rec.get_distance('A', 'D') == 4
+    
+    # ...also when the weights differ only by rounding
+    rec = path_to_tree(['A', 'B', 'C', 'D'], [0.3, 0.1, 0.1 + 0.2])
+    assert len(rec.children) == 3
+    
+    # ...but close integer distances are not tied
+    rec = infer_clocklike_tree1([[0, 2000000, 2000010],
+                                 [2000000, 0, 2000010],
+                                 [2000010, 2000010, 0]], 'ABC')
+    assert rec.get_distance('A', 'B') == 2000000
+    assert len(rec.children) == 2
+# ---
@@ -0,0 +1,62 @@
+import pytest
+from phylogeny import Tree
+from phylogeny.core.consensus import consensus_tree, read_trees, SplitCounter
+
+replicates = ['((A,B),(C,(D,E)));', '((A,B),((C,D),E));', 
+              '((A,C),(B,(D,E)));']
+
+
+def supports(tree):
+    "The support of the clade of each internal node."
+    return {frozenset(node.get_leaf_names()): round(node.support, 2) 
+                for node in tree.traverse() if not node.is_leaf()}
+# ---
+
+def test_consensus():
+    trees = [Tree(replicates[0]), Tree(replicates[1]), replicates[2]]
+    
+    strict = consensus_tree(trees, 'strict')
+    assert supports(strict) == {frozenset('ABCDE'): 1.0}
+    
+    majority = consensus_tree(trees, 'majority')
+    assert supports(majority) == {frozenset('ABCDE'): 1.0, 
+                                  frozenset('AB'): 0.67, 
+                                  frozenset('CDE'): 0.67, 
+                                  frozenset('DE'): 0.67}
+    assert majority.compare(Tree(replicates[0]))['rf'] == 0
+    assert supports(consensus_tree(trees, 'majority', threshold=0.7)) == {
+                                  frozenset('ABCDE'): 1.0}
+    
+    # The greedy consensus resolves the clades of 
+    # a minority when they are compatible
+    partial = replicates[:2] + ['((A,B),C,D,E);']
+    assert len(supports(consensus_tree(partial, 'majority'))) == 3
+    greedy = supports(consensus_tree(partial, 'greedy'))
+    assert len(greedy) == 4 and min(greedy.values()) == 0.33
+    
+    unrooted = consensus_tree(trees, 'majority', unrooted=True)
+    assert unrooted.compare(Tree(replicates[0]), unrooted=True)['rf'] == 0
+    
+    with pytest.raises(ValueError):
+        consensus_tree(trees, 'average')
+# ---
+
+def test_streamed_trees(tmp_path):
+    path = tmp_path / 'replicates.nwk'
+    trees = [Tree(leaves=20) for _ in range(30)]
+    names = trees[0].get_leaf_names()
+    for t in trees:
+        for leaf, name in zip(t, names):
+            leaf.name = name
+    path.write_text('\n'.join(t.write(format=9) for t in trees * 2) + '\n')
+    
+    counter = SplitCounter()
+    counter.update(read_trees(str(path)))
+    assert counter.n_trees == 60
+    
+    in_memory = SplitCounter(names)
+    in_memory.update(trees)
+    for method in ('strict', 'majority', 'greedy'):
+        streamed = counter.consensus(method)
+        assert supports(streamed) == supports(in_memory.consensus(method))
+# ---
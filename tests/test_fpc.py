@@ -0,0 +1,75 @@
+import numpy as np
+from phylogeny.core import DistanceMatrix
+from phylogeny.core.fpc import fpc_sums_block, count_quartets, sample_quartets
+
+
+def test_additivity():
+    # The matrix of a tree is additive
+    additive = DistanceMatrix([[ 0, 3, 7, 8, 9],
+                               [ 3, 0, 6, 7, 8],
+                               [ 7, 6, 0, 5, 6],
+                               [ 8, 7, 5, 0, 3],
+                               [ 9, 8, 6, 3, 0]], names='abcde')
+    assert additive.is_additive()
+    assert additive.condensed().is_additive()
+    assert additive.fpc_violation() is None
+    
+    # Perturb a single distance
+    additive.set(('a','d'), 10)
+    assert not additive.is_additive()
+    quartet, deviation = additive.fpc_violation(worst=True)
+    assert 'a' in quartet and 'd' in quartet
+    assert abs(deviation - 2) < 1e-9
+# ---
+
+def test_small_integer_storage():
+    # The sums of uint16 Hamming counts don't wrap around
+    distances = DistanceMatrix(np.full((4,4), 40_000, dtype=np.uint16))
+    np.fill_diagonal(distances, 0)
+    for matrix in (distances, distances.condensed()):
+        sums = fpc_sums_block(matrix, [[0,1,2,3]])
+        assert (sums == 80_000).all()
+        assert matrix.is_additive()
+    
+    distances.set((0,1), 50_000)
+    assert not distances.is_additive()
+# ---
+
+def test_sampled_additivity():
+    rng = np.random.default_rng(0)
+    noise = rng.random((30,30))
+    noisy = DistanceMatrix(noise + noise.T)
+    
+    estimate = noisy.additivity_estimate(500, seed=1)
+    assert estimate.sampled == 500
+    assert estimate.low <= estimate.violation_rate <= estimate.high
+    assert estimate.violation_rate > 0.5
+    # Reproducible with the same seed
+    assert noisy.additivity_estimate(500, seed=1) == estimate
+    
+    # Sampling every quartet gives the exact rate
+    exact = noisy.additivity_estimate(10**6)
+    assert exact.sampled == 27_405
+    assert exact.low == exact.violation_rate == exact.high
+    
+    # Samples of more than one block of quartets are checked whole
+    noise = rng.random((40,40))
+    larger = DistanceMatrix(noise + noise.T)
+    assert larger.additivity_estimate(70_000, seed=1).sampled == 70_000
+    
+    # The sampled check is still a predicate
+    assert noisy.is_additive(sample=500, seed=1) is False
+    additive = DistanceMatrix(np.add.outer(noise[0], noise[0]))
+    np.fill_diagonal(additive, 0)
+    assert additive.is_additive(sample=500, seed=1) is True
+# ---
+
+def test_sampled_quartets_beyond_int64():
+    n = 130_000
+    assert count_quartets(n) > np.iinfo(np.int64).max
+    quartets = sample_quartets(n, 1000, np.random.default_rng(0))
+    
+    assert quartets.shape == (1000, 4)
+    assert (np.diff(quartets, axis=1) > 0).all()
+    assert len(np.unique(quartets, axis=0)) == 1000
+# ---
@@ -0,0 +1,84 @@
+import random
+import numpy as np
+import pytest
+from phylogeny.core import DistanceMatrix, CondensedDistanceMatrix
+from phylogeny.core.distance import simple_distance
+from phylogeny.core import hamming
+from phylogeny.core.hamming import (HammingAccumulator, pack_bits, 
+                                    pack_sequences, is_binary)
+
+
+def test_packed_hamming():
+    n, n_sites = 20, 150
+    sequences = {i: [random.randint(0,1) for _ in range(n_sites)]
+                    for i in range(n)}
+    
+    # The packed engine must agree with the pairwise fallback
+    fast = DistanceMatrix.from_sequences(sequences, block_size=3)
+    slow = DistanceMatrix.from_sequences(sequences, simple_distance)
+    
+    assert fast.names == slow.names
+    assert (fast == slow).all()
+# ---
+
+def test_packed_in_blocks(monkeypatch):
+    # Convert a few rows at a time
+    monkeypatch.setattr(hamming, '_SEQUENCE_CHARS', 200)
+    rng = np.random.default_rng(0)
+    states = rng.integers(0, 2, size=(30, 70))
+    
+    packed, n_sites = pack_sequences(list(states))
+    assert n_sites == 70
+    assert (packed == pack_bits(states)).all()
+    
+    # A wrong row in a later block is found, even if it would wrap in a byte
+    states[-1, 3] = 256
+    assert not is_binary(states)
+    assert not is_binary(list(states[:-1]) + [states[-1, :60]])
+# ---
+
+def test_non_binary_fallback():
+    sequences = {'a': 'ACGT', 'b': 'ACGA', 'c': 'TCGA'}
+    distances = DistanceMatrix.from_sequences(sequences)
+    
+    assert distances.get(('a','b')) == 1
+    assert distances.get(('a','c')) == 2
+# ---
+
+def test_accumulated_blocks():
+    rng = np.random.default_rng(0)
+    states = rng.integers(0, 2, size=(12, 500))
+    names = [f'seq{i}' for i in range(12)]
+    expected = DistanceMatrix.from_sequences(dict(zip(names, states)))
+    
+    # Adding the blocks of columns gives the distances of the whole
+    accumulator = HammingAccumulator(12, names, block_size=5)
+    for start in range(0, 500, 128):
+        accumulator.add(states[:, start:start+128])
+    assert accumulator.n_sites == 500
+    assert (accumulator.distance_matrix() == expected).all()
+    
+    condensed = accumulator.distance_matrix(CondensedDistanceMatrix,
+                                            normalized=True)
+    assert np.allclose(condensed.to_dense(), expected / 500)
+    
+    # ...also from a stream of packed blocks
+    blocks = ((start, min(500, start+64), 
+               pack_bits(states[:, start:start+64]))
+                 for start in range(0, 500, 64))
+    streamed = DistanceMatrix.from_blocks(blocks, names, packed=True)
+    assert streamed.names == expected.names
+    assert (streamed == expected).all()
+    
+    # The matrices take the type of the accumulator...
+    small = HammingAccumulator(12, names, dtype=np.uint16)
+    small.add(states)
+    assert small.distance_matrix().dtype == np.uint16
+    assert (small.distance_matrix() == expected).all()
+    
+    # ...as long as the counts fit in it
+    tiny = HammingAccumulator(12, names, dtype=np.uint8)
+    tiny.add(states)
+    with pytest.raises(OverflowError):
+        tiny.distance_matrix()
+# ---
@@ -0,0 +1,37 @@
+import gc
+import numpy as np
+from phylogeny.core import DistanceMatrix, CondensedDistanceMatrix
+from phylogeny.core.distance import simple_distance
+
+
+def test_parallel_distances(tmp_path):
+    rng = np.random.default_rng(0)
+    sequences = {f'seq{i}': ''.join(rng.choice(list('ACGT'), 50))
+                    for i in range(15)}
+    expected = DistanceMatrix.from_sequences(sequences, simple_distance)
+    
+    distances = DistanceMatrix.from_sequences(sequences, simple_distance, 
+                                              workers=2)
+    assert distances.names == expected.names
+    assert (distances == expected).all()
+    
+    # Sequences as arrays go through shared memory
+    arrays = {name: np.frombuffer(seq.encode(), dtype=np.uint8)
+                 for name, seq in sequences.items()}
+    condensed = CondensedDistanceMatrix.from_sequences(
+                    arrays, simple_distance, workers=2, dtype=np.uint16)
+    assert (condensed.to_dense() == expected).all()
+    
+    # The entries stay in shared memory while any view of them is alive
+    rows, entries = np.asarray(distances)[1:], condensed.data
+    del distances, condensed
+    gc.collect()
+    assert (rows == np.asarray(expected)[1:]).all()
+    assert (entries == expected.condensed().data).all()
+    
+    # The workers write directly on a memory-mapped matrix
+    path = str(tmp_path / 'distances.dm')
+    DistanceMatrix.from_sequences(sequences, simple_distance, workers=2,
+                                  path=path)
+    assert (DistanceMatrix.open(path) == expected).all()
+# ---
@@ -1,4 +1,4 @@
-from phylogeny.core.distance import simpledistance
+from phylogeny.core.distance import simple_distance
 
 def test_simpledistance():
-    assert simpledistance([0]*10, [1]*4 + [0]*6) == 4
+    assert simple_distance([0]*10, [1]*4 + [0]*6) == 4
@@ -0,0 +1,74 @@
+import numpy as np
+from phylogeny.core import DistanceMatrix, CondensedDistanceMatrix
+
+
+def test_condensed_matrix():
+    dense = DistanceMatrix([[0, 3, 5, 9],
+                            [3, 0, 4, 8],
+                            [5, 4, 0, 6],
+                            [9, 8, 6, 0]], names='abcd')
+    condensed = dense.condensed(dtype=np.uint16)
+    
+    assert condensed.dtype == np.uint16
+    assert len(condensed.data) == 6
+    assert condensed.get(('d','b')) == 8
+    assert condensed.distances_to('c') == dense.distances_to('c')
+    assert list(condensed.name_all()) == list(dense.name_all())
+    
+    # Removal keeps the remaining distances
+    chopped = condensed.remove('b')
+    assert chopped.names == ('a','c','d')
+    assert (chopped.to_dense() == dense.remove('b')).all()
+    
+    # Each distance is written once
+    condensed.set(('a','d'), 7)
+    assert condensed.get(('d','a')) == 7
+# ---
+
+def test_memmap_matrix(tmp_path):
+    sequences = {'a': [0,0,1,1], 'b': [0,1,1,1], 'c': [1,1,0,0]}
+    path = str(tmp_path / 'distances.dm')
+    
+    # Computed directly into the file...
+    computed = CondensedDistanceMatrix.from_sequences(sequences, path=path, 
+                                                      dtype=np.uint16)
+    del computed
+    # ...and reopened later
+    reopened = DistanceMatrix.open(path)
+    assert isinstance(reopened, CondensedDistanceMatrix)
+    assert reopened.names == ('a','b','c')
+    assert reopened.get(('a','c')) == 4
+    
+    # Round trip of an in-memory matrix
+    dense = DistanceMatrix.from_sequences(sequences)
+    dense.save(path)
+    assert (DistanceMatrix.open(path) == dense).all()
+# ---
+
+def test_masked_removal():
+    dense = DistanceMatrix([[0, 3, 5, 9],
+                            [3, 0, 4, 8],
+                            [5, 4, 0, 6],
+                            [9, 8, 6, 0]], names='abcd')
+    for matrix in (dense, dense.condensed()):
+        chopped = matrix.shallow_copy()
+        chopped.discard('b')
+        
+        # Only the live entries are seen...
+        assert chopped.names == ('a','c','d')
+        assert chopped.distances_to('c') == {'a': 5, 'd': 6}
+        assert [d for _,d in chopped.name_all()] == [5, 9, 6]
+        assert chopped.closest_pair() == (('a','c'), 5)
+        # ...while the original matrix is untouched
+        assert matrix.names == ('a','b','c','d')
+        
+        # Compacting copies the live entries out
+        compact = chopped.compact()
+        assert compact.is_compact and len(compact) == 3
+        assert compact.get(('a','d')) == 9
+        
+        # ...like `remove` does
+        removed = matrix.remove('b')
+        assert removed.is_compact and removed.names == compact.names
+        assert list(removed.name_all()) == list(compact.name_all())
+# ---
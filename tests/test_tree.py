@@ -0,0 +1,114 @@
+import itertools as itr
+import numpy as np
+import pytest
+from phylogeny import Tree, CondensedDistanceMatrix
+
+
+def test_distance_matrix(tmp_path):
+    t = Tree()
+    t.populate(50, random_branches=True)
+    leaves = t.get_leaves()
+    
+    distances = t.distance_matrix()
+    assert list(distances.names) == [leaf.name for leaf in leaves]
+    for i,j in itr.combinations(range(len(leaves)), 2):
+        expected = t.get_distance(leaves[i], leaves[j])
+        assert np.isclose(distances[i,j], expected)
+        assert np.isclose(distances[j,i], expected)
+    assert (np.diag(distances) == 0).all()
+    
+    # The same distances in any storage
+    path = str(tmp_path / 'distances.dm')
+    condensed = t.distance_matrix(CondensedDistanceMatrix, np.float32, path)
+    assert np.allclose(condensed.to_dense(), distances)
+    assert condensed.data.dtype == np.float32
+# ---
+
+def test_name_index():
+    t = Tree.from_quartet((('A','B'),('C','D')))
+    for a,b in [('E','A'), ('F','E'), ('G','D')]:
+        t.add_as_sibling(a, b)
+    
+    assert t.compare(Tree('(((A,(E,F)),B),(C,(D,G)));'))['rf'] == 0
+    for name in 'ABCDEFG':
+        assert t.node_of(name) is t.search_nodes(name=name)[0]
+    
+    # Pruning keeps the lookups right
+    t.prune_leaves(['A', 'C', 'D', 'F'])
+    assert sorted(t.get_leaf_names()) == ['A', 'C', 'D', 'F']
+    assert t.node_of('F') is t.search_nodes(name='F')[0]
+    
+    # ...as do the changes made with other methods
+    t.node_of('D').detach()
+    t.add_child(name='D')
+    assert t.node_of('D') is t.search_nodes(name='D')[0]
+    
+    # The nodes of a detached subtree are not found in the tree
+    t = Tree('((a,b)x,(c,d)y);', format=1)
+    detached = t.node_of('a')
+    t.node_of('x').detach()
+    with pytest.raises(KeyError):
+        t.node_of('a')
+    
+    # ...and the name can be taken by a node of the tree
+    t.node_of('y').add_child(name='a')
+    assert t.node_of('a') is not detached
+    assert t.node_of('a').up.name == 'y'
+# ---
+
+def test_rf_distances():
+    reference = Tree()
+    reference.populate(20)
+    names = reference.get_leaf_names()
+    trees = [reference.copy()]
+    for _ in range(10):
+        t = Tree()
+        t.populate(20, names_library=names)
+        trees.append(t)
+    
+    for unrooted in (False, True):
+        expected = [reference.compare(t, unrooted=unrooted) for t in trees]
+        rf = reference.rf_distances(trees, unrooted)
+        assert rf.tolist() == [e['rf'] for e in expected]
+        assert rf[0] == 0
+        norm_rf = reference.rf_distances(trees, unrooted, normalized=True)
+        assert np.allclose(norm_rf, [e['norm_rf'] for e in expected])
+    
+    # The same distances from newick strings, in worker processes
+    newicks = [t.write(format=9) for t in trees]
+    assert (reference.rf_distances(newicks, workers=2) 
+            == reference.rf_distances(trees)).all()
+    assert reference.rf_distance(trees[1], unrooted=True) == rf[1]
+# ---
+
+def test_splits():
+    t = Tree('((A,B),(C,(D,E)));')
+    splits = t.splits()
+    assert set(splits) == {frozenset('AB'), frozenset('CDE'), frozenset('DE')}
+    assert {'D', 'E'} in splits and {'A', 'C'} not in splits
+    assert set(t.splits(unrooted=True)) == {frozenset('DE'), frozenset('CDE')}
+    assert t.splits() is splits
+    
+    # Set operations, whatever the order of the leaves
+    other = Tree('((A,C),(B,(E,D)));').splits()
+    assert set(splits & other) == {frozenset('DE')}
+    assert set(splits - other) == {frozenset('AB'), frozenset('CDE')}
+    assert len(splits | other) == 5 and len(splits ^ other) == 4
+    assert splits.rf_distance(other) == t.compare(Tree('((A,C),(B,(E,D)));'))['rf']
+    same = Tree('((C,(E,D)),(B,A));').splits()
+    assert same == splits and hash(same) == hash(splits)
+    assert (splits & other) <= splits and not splits.isdisjoint(other)
+    with pytest.raises(TypeError, match="'<='"):
+        splits <= [frozenset('AB')]
+    
+    # The cache follows the changes of the tree
+    t.search_nodes(name='E')[0].name = 'F'
+    assert {'D', 'F'} in t.splits()
+    t.search_nodes(name='D')[0].detach()
+    assert set(t.splits()) == {frozenset('AB'), frozenset('CF')}
+    t.add_as_sibling('G', 'A')
+    assert {'A', 'G'} in t.splits() and {'A', 'B', 'G'} in t.splits()
+    t.set_outgroup('C')
+    assert set(t.splits()) == {frozenset('ABG'), frozenset('AG'), 
+                               frozenset('ABFG')}
+# ---